@@ -14,9 +14,11 @@ except ImportError:
     print("install uvicorn and pydantic-settings to use the dev server", file=stderr)
     exit(1)
 
-from stapi_fastapi.api import StapiRouter
-
 from stapi_fastapi_umbra import UmbraBackend
+from stapi_fastapi_umbra.client import disk_cache
+from stapi_fastapi_umbra.cursors import CursorStore
+from stapi_fastapi_umbra.metrics import metrics
+from stapi_fastapi_umbra.stapi_fastapi.api import StapiRouter
 
 logger = logging.getLogger(__name__)
 
@@ -28,7 +30,17 @@ logger.info(
 )
 
 app = FastAPI(debug=True)
-app.include_router(StapiRouter(backend=UmbraBackend()).router)
+app.include_router(
+    StapiRouter(
+        backend=UmbraBackend(),
+        cursors=CursorStore.from_settings(settings, store=disk_cache),
+    ).router
+)
+
+
+@app.get("/metrics", include_in_schema=False)
+def get_metrics() -> dict:
+    return metrics.snapshot()
 
 
 def cli():
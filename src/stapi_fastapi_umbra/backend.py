@@ -1,25 +1,83 @@
 """Umbra Backend Module"""
 
+import asyncio
+import json
 import logging
+from collections.abc import AsyncIterator, Awaitable
 from datetime import datetime, timezone
+from typing import TypeVar
+from uuid import UUID
 
+import httpx
 from fastapi import HTTPException, Request, status
-from stapi_fastapi.models.opportunity import Opportunity, OpportunityRequest
+from pydantic import ValidationError
+from stapi_fastapi.models.opportunity import OpportunityRequest
 from stapi_fastapi.models.order import Order
 from stapi_fastapi.models.product import Product
 
-from stapi_fastapi_umbra.client import AuthorizationError, Client
+from stapi_fastapi_umbra.client import (
+    AuthorizationError,
+    Client,
+    archive_request,
+    next_archive_request,
+)
+from stapi_fastapi_umbra.codec import adapter, decode
+from stapi_fastapi_umbra.deadline import (
+    ClientDisconnected,
+    request_timeout,
+    run_with_deadline,
+)
+from stapi_fastapi_umbra.events import TaskEvents
+from stapi_fastapi_umbra.models import UmbraOpportunity
+from stapi_fastapi_umbra.opportunities import (
+    stac_items_to_opportunity_set,
+    umbra_opportunities_to_opportunity_set,
+)
+from stapi_fastapi_umbra.opportunity_set import OpportunitySet
 from stapi_fastapi_umbra.products import PRODUCTS
 from stapi_fastapi_umbra.settings import Settings
+from stapi_fastapi_umbra.stats import ArchiveStats
 
 settings = Settings.load()
+task_events = TaskEvents.from_settings(settings)
+
+T = TypeVar("T")
 
 logger = logging.getLogger(__name__)
 
+# Non-standard status (from nginx) for requests abandoned by the caller.
+HTTP_499_CLIENT_CLOSED_REQUEST = 499
+
+
+def canopy_token_from_request(request: Request) -> str | None:
+    """
+    The caller's own bearer token, forwarded to Canopy, falling back to the
+    process-wide `canopy_token` setting.
+    """
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and token:
+        return token
+    return settings.canopy_token
+
 
 class UmbraBackend:
     """Umbra STAT Backend"""
 
+    async def _with_deadline(
+        self, request: Request, client: Client, work: Awaitable[T], default_timeout: float
+    ) -> T:
+        """
+        Run the upstream `work` for a request under its deadline, cancelling it
+        if the deadline passes or the caller disconnects.
+        """
+        timeout = request_timeout(request, default_timeout, settings.request_timeout_max)
+        try:
+            return await run_with_deadline(request, work, timeout, client.tenant)
+        except TimeoutError as err:
+            raise HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail=str(err))
+        except ClientDisconnected as err:
+            raise HTTPException(status_code=HTTP_499_CLIENT_CLOSED_REQUEST, detail=str(err))
+
     def products(self, request: Request) -> list[Product]:
         """
         Return a list of supported products.
@@ -38,11 +96,12 @@ class UmbraBackend:
 
     async def search_opportunities(
         self, search: OpportunityRequest, request: Request
-    ) -> list[Opportunity]:
+    ) -> OpportunitySet:
         """
         Search for ordering opportunities for the given search parameters.
         Opportunities might include existing images from the archive or
-        new opportunities from feasibility.
+        new opportunities from feasibility, returned as a columnar
+        `OpportunitySet` rather than a list of `Opportunity` models.
 
         Backends must validate search constraints and raise
         `stapi_fastapi.backend.exceptions.ConstraintsException` if not valid.
@@ -53,6 +112,56 @@ class UmbraBackend:
                 detail=f"No available products matching id {search.product_id}",
             )
 
+        client = Client(
+            canopy_api_url=settings.canopy_api_url,
+            canopy_token=canopy_token_from_request(request),
+        )
+
+        return await self._with_deadline(
+            request,
+            client,
+            self._search_opportunities(search, client),
+            settings.opportunities_timeout,
+        )
+
+    async def search_opportunities_page(
+        self,
+        search: OpportunityRequest,
+        request: Request,
+        limit: int,
+        position: dict | None = None,
+    ) -> tuple[OpportunitySet, dict | None]:
+        """
+        Up to `limit` opportunities for the search, starting at `position`,
+        and the position of the page after them, or `None` if this is the last
+        page. Archive results come first, fetched a Canopy page at a time as
+        the position reaches them, followed by feasibility results.
+
+        The position carries the Canopy archive page it stopped in and the
+        feasibility results, as bytes, so the pages after it are cut from
+        those rather than fetched again.
+        """
+        if search.product_id != "umbra_spotlight":
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"No available products matching id {search.product_id}",
+            )
+
+        client = Client(
+            canopy_api_url=settings.canopy_api_url,
+            canopy_token=canopy_token_from_request(request),
+        )
+
+        return await self._with_deadline(
+            request,
+            client,
+            self._search_opportunities_page(search, client, limit, position),
+            settings.opportunities_timeout,
+        )
+
+    async def _search_opportunities(
+        self, search: OpportunityRequest, client: Client
+    ) -> OpportunitySet:
         start_time, end_time = search.datetime
 
         now_utc = datetime.now(tz=timezone.utc)
@@ -60,18 +169,94 @@ class UmbraBackend:
         archive_included = start_time < now_utc
         archive_only = end_time < now_utc
 
-        settings = Settings()
-        client = Client(
-            canopy_api_url=settings.canopy_api_url,
-            canopy_token=settings.canopy_token,
+        opportunities_from_archive = (
+            await self._archive_leg(client.get_opportunities_from_archive(search))
+            if archive_included
+            else OpportunitySet.empty(search.product_id)
+        )
+        opportunities_from_feasibility = (
+            await self._feasibility_leg(client.get_opportunities_from_feasibility(search))
+            if not archive_only
+            else OpportunitySet.empty(search.product_id)
         )
 
-        try:
-            opportunities_from_archive = (
-                await client.get_opportunities_from_archive(search)
-                if archive_included
-                else []
+        return OpportunitySet.concat(
+            [opportunities_from_archive, opportunities_from_feasibility]
+        )
+
+    async def _search_opportunities_page(
+        self, search: OpportunityRequest, client: Client, limit: int, position: dict | None
+    ) -> tuple[OpportunitySet, dict | None]:
+        start_time, end_time = search.datetime
+        now_utc = datetime.now(tz=timezone.utc)
+        if position is None:
+            position = {
+                "archive": archive_request(search) if start_time < now_utc else None,
+                "archive_page": None,
+                "archive_offset": 0,
+                "feasibility": None,
+                "feasibility_offset": 0,
+            }
+
+        archive, position = await self._archive_page_items(search, client, limit, position)
+        remaining = limit - len(archive)
+        if end_time < now_utc:
+            return archive, position if position["archive"] is not None else None
+        if remaining == 0:
+            return archive, position
+
+        content = position.get("feasibility")
+        if content is None:
+            content = adapter(list[UmbraOpportunity]).dump_json(
+                await self._feasibility_leg(client.get_feasibility_opportunities(search))
             )
+        feasibility = umbra_opportunities_to_opportunity_set(
+            decode(list[UmbraOpportunity], content),
+            geometry=search.geometry,
+            product_id=search.product_id,
+        )
+        offset = position["feasibility_offset"]
+        page = feasibility.take(slice(offset, offset + remaining))
+        offset += len(page)
+        next_position = (
+            {**position, "feasibility": content, "feasibility_offset": offset}
+            if offset < len(feasibility)
+            else None
+        )
+        return OpportunitySet.concat([archive, page]), next_position
+
+    async def _archive_page_items(
+        self, search: OpportunityRequest, client: Client, limit: int, position: dict
+    ) -> tuple[OpportunitySet, dict]:
+        """
+        Up to `limit` archive opportunities from `position`, following `next`
+        links only as far as needed, and the position after them
+        """
+        archive, offset = position["archive"], position["archive_offset"]
+        content = position.get("archive_page")
+        pages = [OpportunitySet.empty(search.product_id)]
+        remaining = limit
+        while archive is not None and remaining > 0:
+            if content is None:
+                content = await self._archive_leg(client.get_archive_page_content(tuple(archive)))
+            page = json.loads(content)
+            items = stac_items_to_opportunity_set(page["features"], product_id=search.product_id)
+            pages.append(items.take(slice(offset, offset + remaining)))
+            remaining -= len(pages[-1])
+            if offset + len(pages[-1]) < len(items):
+                offset += len(pages[-1])
+                break
+            archive, content, offset = next_archive_request(page, tuple(archive)), None, 0
+
+        position = {**position, "archive": archive, "archive_page": content, "archive_offset": offset}
+        return OpportunitySet.concat(pages), position
+
+    @staticmethod
+    async def _archive_leg(work: Awaitable[T]) -> T:
+        try:
+            return await work
+        except TimeoutError:
+            raise
         except Exception:
             logger.exception("Failed to retrieve opportunities from archive")
             raise HTTPException(
@@ -79,17 +264,17 @@ class UmbraBackend:
                 detail="Unable to retrieve opportunities from archive",
             )
 
+    @staticmethod
+    async def _feasibility_leg(work: Awaitable[T]) -> T:
         try:
-            opportunities_from_feasibility = (
-                (await client.get_opportunities_from_feasibility(search))
-                if not archive_only
-                else []
-            )
+            return await work
         except AuthorizationError as err:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail=str(err),
             )
+        except TimeoutError:
+            raise
         except Exception:
             logger.exception("Failed to retrieve opportunities from feasibility")
             raise HTTPException(
@@ -97,7 +282,64 @@ class UmbraBackend:
                 detail="Unable to retrieve opportunities from feasibility",
             )
 
-        return opportunities_from_archive + opportunities_from_feasibility
+    async def opportunity_stats(self, search: OpportunityRequest, request: Request) -> dict:
+        """
+        Aggregate archive coverage for the search: scene counts per month,
+        platform, grazing angle band and target azimuth band. Archive pages
+        are folded into the statistics as they arrive; if the page limit or
+        the deadline is reached first, the counts so far are returned marked
+        `truncated`.
+        """
+        if search.product_id != "umbra_spotlight":
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"No available products matching id {search.product_id}",
+            )
+
+        client = Client(
+            canopy_api_url=settings.canopy_api_url,
+            canopy_token=canopy_token_from_request(request),
+        )
+        start_time, end_time = search.datetime
+        end_time = min(end_time, datetime.now(tz=timezone.utc))
+        stats = ArchiveStats(start_time, max(start_time, end_time))
+
+        try:
+            await self._with_deadline(
+                request,
+                client,
+                self._opportunity_stats(search, client, stats),
+                settings.opportunity_stats_timeout,
+            )
+        except HTTPException as err:
+            if err.status_code != status.HTTP_504_GATEWAY_TIMEOUT:
+                raise
+            stats.truncated = True
+
+        return stats.to_dict()
+
+    async def _opportunity_stats(
+        self, search: OpportunityRequest, client: Client, stats: ArchiveStats
+    ) -> None:
+        archive = archive_request(search, settings.archive_stats_page_size)
+        try:
+            for _ in range(settings.archive_stats_max_pages):
+                page = await client.get_archive_page(archive, cache=False)
+                stats.add(page["features"])
+                archive = next_archive_request(page, archive)
+                if archive is None:
+                    return
+        except TimeoutError:
+            raise
+        except Exception:
+            logger.exception("Failed to retrieve archive statistics")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Unable to retrieve archive statistics",
+            )
+
+        logger.warning(f"archive statistics truncated at {settings.archive_stats_max_pages} pages")
+        stats.truncated = True
 
     async def create_order(self, search: OpportunityRequest, request: Request) -> Order:
         """
@@ -114,13 +356,97 @@ class UmbraBackend:
 
         client = Client(
             canopy_api_url=settings.canopy_api_url,
-            canopy_token=settings.canopy_token,
+            canopy_token=canopy_token_from_request(request),
         )
 
-        order = client.create_order_from_opportunity_request(search)
+        order = await self._with_deadline(
+            request,
+            client,
+            client.create_order_from_opportunity_request(search),
+            settings.orders_timeout,
+        )
 
         return order
 
+    async def _create_batch_order(self, search: OpportunityRequest, request: Request) -> Order:
+        """`create_order` for one batch item, with failures mapped to HTTP errors"""
+        try:
+            return await self.create_order(search, request)
+        except AuthorizationError as err:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=str(err))
+        except httpx.HTTPStatusError as err:
+            logger.warning(f"canopy rejected task request: {err.response.text}")
+            raise HTTPException(
+                status_code=err.response.status_code,
+                detail="Canopy rejected the task request",
+            )
+        except HTTPException:
+            raise
+        except ValidationError:
+            # An unexpected Canopy response rather than a bad request.
+            logger.exception("unable to create order")
+            raise
+        except ValueError as err:
+            # Requests Canopy can't task, e.g. non-Point geometry.
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(err)
+            )
+        except Exception:
+            logger.exception("unable to create order")
+            raise
+
+    async def create_orders(
+        self, searches: list[OpportunityRequest], request: Request
+    ) -> list[Order | Exception]:
+        """
+        Create an order for each search concurrently, with at most
+        `order_batch_concurrency` Canopy task requests in flight. Returns the
+        order or the exception for each search, in order.
+
+        The whole batch runs under one deadline (`order_batch_timeout`, or the
+        caller's `Request-Timeout`) that each item's own deadline is bounded
+        by; items that haven't finished when it passes are reported as `504`.
+        Canopy has no batch tasking endpoint, so each order is its own task
+        request.
+        """
+        if len(searches) > settings.order_batch_max_size:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"At most {settings.order_batch_max_size} orders can be submitted at once",
+            )
+
+        client = Client(
+            canopy_api_url=settings.canopy_api_url,
+            canopy_token=canopy_token_from_request(request),
+        )
+        semaphore = asyncio.Semaphore(settings.order_batch_concurrency)
+        results: list[Order | Exception | None] = [None] * len(searches)
+
+        async def create(i: int, search: OpportunityRequest) -> None:
+            async with semaphore:
+                try:
+                    results[i] = await self._create_batch_order(search, request)
+                except Exception as err:
+                    results[i] = err
+
+        async def create_all() -> None:
+            # The items' tasks are created by gather, so they only inherit the
+            # batch deadline if gather runs inside the batch's own task.
+            await asyncio.gather(*(create(i, search) for i, search in enumerate(searches)))
+
+        try:
+            # Only the batch deadline is mapped here; unfinished items are
+            # reported below, and created orders are kept.
+            await self._with_deadline(request, client, create_all(), settings.order_batch_timeout)
+        except HTTPException as err:
+            if err.status_code != status.HTTP_504_GATEWAY_TIMEOUT:
+                raise
+
+        timed_out = HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail="batch deadline exceeded"
+        )
+        return [timed_out if result is None else result for result in results]
+
     async def get_order(self, order_id: str, request: Request) -> Order:
         """
         Get details for order with `order_id`.
@@ -131,9 +457,45 @@ class UmbraBackend:
 
         client = Client(
             canopy_api_url=settings.canopy_api_url,
-            canopy_token=settings.canopy_token,
+            canopy_token=canopy_token_from_request(request),
         )
 
-        order = client.get_order_by_id(order_id)
+        order = await self._with_deadline(
+            request, client, client.get_order_by_id(order_id), settings.orders_timeout
+        )
 
         return order
+
+    def order_events(self, order_ids: list[str], request: Request) -> AsyncIterator[str]:
+        """
+        Server-Sent Events with the status of each order in `order_ids` until
+        it reaches a terminal status or the caller disconnects. Callers
+        watching the same order with the same credential share one poller.
+        """
+        if not order_ids:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail="No order ids given"
+            )
+        if len(order_ids) > settings.order_events_max_ids:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"At most {settings.order_events_max_ids} orders can be watched at once",
+            )
+        try:
+            task_ids = [str(UUID(order_id)) for order_id in order_ids]
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="order_id must be a valid UUID"
+            )
+
+        client = Client(
+            canopy_api_url=settings.canopy_api_url,
+            canopy_token=canopy_token_from_request(request),
+        )
+        if not client.canopy_token:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="canopy_token is required to watch orders",
+            )
+
+        return task_events.stream(client, task_ids, request)
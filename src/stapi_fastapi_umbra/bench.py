@@ -0,0 +1,456 @@
+"""Benchmarks for the request hot paths
+
+Each benchmark builds a synthetic workload in-process, with no Canopy and
+no network, and prints one line per measurement, so figures quoted for a
+change can be reproduced and compared before and after it. `--scale`
+shrinks or grows every workload, e.g. for a quick check in CI.
+
+    umbra-bench
+    umbra-bench feasibility-cache --scale 0.1
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import multiprocessing
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections.abc import Callable
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import httpx
+from geojson_pydantic import Point
+
+from stapi_fastapi_umbra import formats
+from stapi_fastapi_umbra.cache import FeasibilityCache
+from stapi_fastapi_umbra.client import tenant_id
+from stapi_fastapi_umbra.codec import decode, encode, read_status
+from stapi_fastapi_umbra.metrics import metrics
+from stapi_fastapi_umbra.models import (
+    FeasibilityRequest,
+    FeasibilityResponse,
+    SpotlightConstraints,
+    UmbraOpportunity,
+)
+from stapi_fastapi_umbra.opportunities import (
+    stac_items_to_opportunity_set,
+    umbra_opportunities_to_opportunity_set,
+)
+from stapi_fastapi_umbra.opportunity_set import OpportunitySet
+from stapi_fastapi_umbra.soak import POINT, TOKEN, CanopyStub, build_app
+from stapi_fastapi_umbra.store import METRICS_TENANT, DiskCache
+
+START = datetime(2030, 1, 1, tzinfo=timezone.utc)
+
+
+@dataclass
+class Measurement:
+    name: str
+    value: float
+    unit: str
+
+
+Benchmark = Callable[[float], list[Measurement]]
+
+BENCHMARKS: dict[str, Benchmark] = {}
+
+
+def benchmark(name: str) -> Callable[[Benchmark], Benchmark]:
+    def register(fn: Benchmark) -> Benchmark:
+        BENCHMARKS[name] = fn
+        return fn
+
+    return register
+
+
+def _scaled(n: int, scale: float) -> int:
+    return max(int(n * scale), 2)
+
+
+def _per_call(fn: Callable[[], object], repeat: int = 5) -> float:
+    """Best time of `repeat` calls of `fn`, in seconds"""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def _retained(build: Callable[[], object]) -> int:
+    """Bytes still allocated by `build` while its result is alive"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = build()
+        gc.collect()
+        size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return size
+
+
+def _umbra_opportunities(start: datetime, count: int, step: timedelta) -> list[UmbraOpportunity]:
+    return [
+        UmbraOpportunity(
+            windowStartAt=start + step * i + timedelta(minutes=10),
+            windowEndAt=start + step * i + timedelta(minutes=10, seconds=12),
+            durationSec=12.0,
+            grazingAngleStartDegrees=40.0,
+            grazingAngleEndDegrees=45.0,
+            targetAzimuthAngleStartDegrees=10.0,
+            targetAzimuthAngleEndDegrees=20.0,
+            satelliteId=f"Umbra-{4 + i % 5:02d}",
+        )
+        for i in range(count)
+    ]
+
+
+def _archive_search() -> dict:
+    """A search of the last 30 days, answered from the archive alone"""
+    now = datetime.now(tz=timezone.utc)
+    return {
+        "geometry": POINT,
+        "datetime": f"{(now - timedelta(days=30)).isoformat()}/{now.isoformat()}",
+        "product_id": "umbra_spotlight",
+    }
+
+
+async def _fetch_hourly(
+    constraints: SpotlightConstraints, start: datetime, end: datetime
+) -> list[UmbraOpportunity]:
+    """A feasibility fetcher finding one opportunity an hour"""
+    return _umbra_opportunities(start, int((end - start) / timedelta(hours=1)), timedelta(hours=1))
+
+
+@benchmark("feasibility-cache")
+def feasibility_cache(scale: float) -> list[Measurement]:
+    """A 7-day feasibility window advanced an hour at a time"""
+    window = timedelta(days=7)
+    steps = _scaled(168, scale)
+    constraints = SpotlightConstraints(geometry=POINT)
+    fetched: list[float] = []
+
+    async def fetch(
+        constraints: SpotlightConstraints, start: datetime, end: datetime
+    ) -> list[UmbraOpportunity]:
+        fetched.append((end - start) / timedelta(hours=1))
+        return await _fetch_hourly(constraints, start, end)
+
+    async def run() -> float:
+        cache = FeasibilityCache()
+        await cache.get_opportunities(constraints, START, START + window, fetch, "bench")
+        started = time.perf_counter()
+        for step in range(1, steps + 1):
+            start = START + timedelta(hours=step)
+            await cache.get_opportunities(constraints, start, start + window, fetch, "bench")
+        return (time.perf_counter() - started) / steps
+
+    seconds = asyncio.run(run())
+    first, later = fetched[0], fetched[1:]
+    return [
+        Measurement("first query: hours fetched", first, "h"),
+        Measurement("later queries: Canopy calls per query", len(later) / steps, "calls"),
+        Measurement("later queries: hours fetched per query", sum(later) / steps, "h"),
+        Measurement("later queries: time per query", seconds * 1e3, "ms"),
+    ]
+
+
+@benchmark("fair-scheduling")
+def fair_scheduling(scale: float) -> list[Measurement]:
+    """One caller floods archive searches while another searches one at a time"""
+    flood, interactive = _scaled(500, scale), _scaled(20, scale)
+    stub = CanopyStub(latency=0.005)
+    search = _archive_search()
+    tokens = {"flooding": "bench-flooding-token", "interactive": "bench-interactive-token"}
+
+    async def run() -> None:
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=build_app(stub)), base_url="http://bench"
+        ) as http:
+
+            async def search_as(token: str) -> None:
+                response = await http.post(
+                    "/opportunities", json=search, headers={"Authorization": f"Bearer {token}"}
+                )
+                response.raise_for_status()
+
+            flooding = [asyncio.create_task(search_as(tokens["flooding"])) for _ in range(flood)]
+            await asyncio.sleep(0)
+            for _ in range(interactive):
+                await search_as(tokens["interactive"])
+            await asyncio.gather(*flooding)
+
+    metrics.reset()
+    asyncio.run(run())
+    snapshot = metrics.snapshot()
+    return [
+        Measurement(
+            f"{caller} caller: Canopy call p95",
+            snapshot[tenant_id(token)]["latency_p95_seconds"] * 1e3,
+            "ms",
+        )
+        for caller, token in tokens.items()
+    ]
+
+
+@benchmark("opportunity-set")
+def opportunity_set(scale: float) -> list[Measurement]:
+    """Feasibility opportunities held as columns rather than models"""
+    count = _scaled(20_000, scale)
+    umbra = _umbra_opportunities(START, count, timedelta(minutes=20))
+    geometry = Point(**POINT)
+
+    def columns():
+        return umbra_opportunities_to_opportunity_set(umbra, geometry, "umbra_spotlight")
+
+    opportunities = columns()
+    return [
+        Measurement("OpportunitySet: memory per feature", _retained(columns) / count, "B"),
+        Measurement(
+            "Opportunity models: memory per feature",
+            _retained(opportunities.to_opportunities) / count,
+            "B",
+        ),
+        Measurement("OpportunitySet: build per feature", _per_call(columns) / count * 1e6, "us"),
+        Measurement(
+            "Opportunity models: build per feature",
+            _per_call(opportunities.to_opportunities, repeat=1) / count * 1e6,
+            "us",
+        ),
+        Measurement(
+            "GeoJSON encoding per feature",
+            _per_call(opportunities.to_geojson_bytes) / count * 1e6,
+            "us",
+        ),
+    ]
+
+
+def _read_each(path: str, keys: list[str]) -> tuple[float, int]:
+    """
+    Seconds per single-key feasibility read of `keys` from `path` in this
+    process, and the number of hits
+    """
+    store = DiskCache(path)
+    try:
+        store.get_many("feasibility", keys[:1])
+        started = time.perf_counter()
+        hits = sum(len(store.get_many("feasibility", [key])) for key in keys)
+        return (time.perf_counter() - started) / len(keys), hits
+    finally:
+        store.close()
+
+
+@benchmark("disk-cache")
+def disk_cache(scale: float) -> list[Measurement]:
+    """Feasibility buckets read back from the SQLite tier, here and by other processes"""
+    hours = _scaled(168, scale)
+    readers = 4
+    end = START + timedelta(hours=hours)
+    constraints = SpotlightConstraints(geometry=POINT)
+    calls: list[datetime] = []
+
+    async def fetch(
+        constraints: SpotlightConstraints, start: datetime, end: datetime
+    ) -> list[UmbraOpportunity]:
+        calls.append(start)
+        return await _fetch_hourly(constraints, start, end)
+
+    async def window(store: DiskCache) -> None:
+        # A fresh in-memory tier, as in another worker or after a restart
+        await FeasibilityCache(store=store).get_opportunities(constraints, START, end, fetch, "a")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = DiskCache(Path(tmp) / "cache.db")
+        try:
+            asyncio.run(window(store))
+            keys = [key for key, in store._connection().execute("SELECT key FROM cache")]
+            batched = _per_call(lambda: store.get_many("feasibility", keys))
+            one_by_one = _per_call(lambda: [store.get_many("feasibility", [k]) for k in keys])
+            metrics.reset()
+            warm = _per_call(lambda: asyncio.run(window(store)))
+            counters = metrics.snapshot()[METRICS_TENANT]
+            # Other workers: separate processes with their own connections
+            # and memory maps of the same file
+            with multiprocessing.get_context("spawn").Pool(readers) as pool:
+                read = pool.starmap(_read_each, [(str(store.path), keys)] * readers)
+        finally:
+            store.close()
+
+    return [
+        Measurement("buckets in window", len(keys), "buckets"),
+        Measurement("batched read of the window", batched * 1e3, "ms"),
+        Measurement("per-bucket reads of the window", one_by_one * 1e3, "ms"),
+        Measurement(
+            "warm start: disk hit rate",
+            counters["feasibility_hits"]
+            / (counters["feasibility_hits"] + counters["feasibility_misses"])
+            * 100,
+            "%",
+        ),
+        Measurement("warm start: Canopy calls", len(calls) - 1, "calls"),
+        Measurement("warm start: time per window", warm * 1e3, "ms"),
+        Measurement(
+            f"{readers} reader processes: hit rate",
+            sum(hits for _, hits in read) / (readers * len(keys)) * 100,
+            "%",
+        ),
+        Measurement(
+            f"{readers} reader processes: time per hit",
+            sum(seconds for seconds, _ in read) / readers * 1e6,
+            "us",
+        ),
+    ]
+
+
+@benchmark("codec")
+def codec(scale: float) -> list[Measurement]:
+    """A feasibility request sent and its completed response read"""
+    count = _scaled(300, scale)
+    request = FeasibilityRequest(
+        spotlightConstraints=SpotlightConstraints(geometry=POINT),
+        windowStartAt=START,
+        windowEndAt=START + timedelta(days=7),
+    )
+    response = FeasibilityResponse(
+        id="bench",
+        createdAt=START,
+        updatedAt=START,
+        opportunities=_umbra_opportunities(START, count, timedelta(minutes=30)),
+        feasibilityRequest=request,
+    )
+    content = encode(response)[:-1] + b', "status": "COMPLETED"}'
+
+    def via_bytes() -> FeasibilityResponse:
+        encode(request)
+        read_status(content)
+        return decode(FeasibilityResponse, content)
+
+    def via_dicts() -> FeasibilityResponse:
+        # What httpx's `json=` and `response.json()` plus model_validate do
+        json.dumps(request.model_dump(mode="json")).encode()
+        json.loads(content)["status"]
+        return FeasibilityResponse.model_validate(json.loads(content))
+
+    return [
+        Measurement("opportunities in response", count, "opportunities"),
+        Measurement("bytes: encode, status and validate", _per_call(via_bytes) * 1e3, "ms"),
+        Measurement("dicts: encode, status and validate", _per_call(via_dicts) * 1e3, "ms"),
+    ]
+
+
+@benchmark("paging")
+def paging(scale: float) -> list[Measurement]:
+    """An archive search read to the end 50 results at a time"""
+    stub = CanopyStub(archive_items=_scaled(5_000, scale), archive_page_size=100)
+    search = _archive_search()
+
+    async def run() -> tuple[list[float], list[int]]:
+        seconds, upstream = [], []
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=build_app(stub)),
+            base_url="http://bench",
+            headers={"Authorization": f"Bearer {TOKEN}"},
+        ) as http:
+            url, body = "/opportunities?limit=50", search
+            while url is not None:
+                requests, started = stub.archive_requests, time.perf_counter()
+                response = await http.post(url, json=body)
+                seconds.append(time.perf_counter() - started)
+                upstream.append(stub.archive_requests - requests)
+                response.raise_for_status()
+                link = next(
+                    (link for link in response.json().get("links", []) if link["rel"] == "next"),
+                    None,
+                )
+                url, body = (link["href"], link["body"]) if link else (None, None)
+        return seconds, upstream
+
+    seconds, upstream = asyncio.run(run())
+    return [
+        Measurement("pages", len(seconds), "pages"),
+        Measurement("first page", seconds[0] * 1e3, "ms"),
+        Measurement("last page", seconds[-1] * 1e3, "ms"),
+        Measurement("archive requests per page, mean", sum(upstream) / len(upstream), "requests"),
+        Measurement("archive requests per page, max", max(upstream), "requests"),
+    ]
+
+
+def _mixed_set(count: int) -> OpportunitySet:
+    """Half archive scenes with their own footprints, half tasking points"""
+    stub = CanopyStub(archive_items=count // 2)
+    archive = stac_items_to_opportunity_set(
+        stub._archive_page({})["features"], product_id="umbra_spotlight"
+    )
+    tasking = umbra_opportunities_to_opportunity_set(
+        _umbra_opportunities(START, count - count // 2, timedelta(minutes=20)),
+        Point(**POINT),
+        "umbra_spotlight",
+    )
+    return OpportunitySet.concat([archive, tasking])
+
+
+@benchmark("formats")
+def formats_(scale: float) -> list[Measurement]:
+    """Opportunities encoded as GeoJSON and each columnar format"""
+    encoders = {"GeoJSON": lambda o: [o.to_geojson_bytes()]}
+    for label, media_type in [
+        ("Arrow stream", formats.ARROW_STREAM),
+        ("GeoParquet", formats.GEOPARQUET),
+        ("MessagePack", formats.MSGPACK),
+    ]:
+        try:
+            formats.require(media_type)
+        except formats.FormatUnavailable:
+            continue
+        encoders[label] = lambda o, media_type=media_type: list(formats.encode(o, media_type))
+
+    measurements = []
+    for count in (_scaled(1_000, scale), _scaled(100_000, scale)):
+        opportunities = _mixed_set(count)
+        for label, encoder in encoders.items():
+            size = sum(len(chunk) for chunk in encoder(opportunities))
+            seconds = _per_call(lambda: encoder(opportunities), repeat=3)
+            measurements += [
+                Measurement(f"{count} features, {label}: time", seconds * 1e3, "ms"),
+                Measurement(f"{count} features, {label}: size", size / 1e6, "MB"),
+            ]
+    return measurements
+
+
+def run(names: list[str], scale: float, file=sys.stdout) -> dict[str, list[Measurement]]:
+    results = {}
+    for name in names:
+        results[name] = BENCHMARKS[name](scale)
+        for m in results[name]:
+            print(f"{name:24} {m.name:52} {m.value:12.3f} {m.unit}", file=file)
+    return results
+
+
+def cli():
+    parser = argparse.ArgumentParser(description="Benchmark the request hot paths")
+    parser.add_argument(
+        "benchmarks", nargs="*", help=f"benchmarks to run (default: all of {list(BENCHMARKS)})"
+    )
+    parser.add_argument(
+        "--scale", type=float, default=1.0, help="multiplier for every workload size"
+    )
+    args = parser.parse_args()
+
+    # Per-request logging would be most of what's measured.
+    logging.disable(logging.INFO)
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        raise SystemExit(f"unknown benchmarks {sorted(unknown)}, choose from {list(BENCHMARKS)}")
+    run(args.benchmarks or list(BENCHMARKS), args.scale)
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,222 @@
+"""Feasibility result cache
+
+Feasibility requests for the same point frequently differ only in their
+window (e.g. "the next 7 days" re-queried every hour). Results are stored
+in fixed-width time buckets keyed by the caller's Canopy credential, the
+quantized target point and the remaining spotlight constraints, so that a new window is answered from
+cached buckets and only the uncovered sub-intervals go to Canopy. Buckets
+are also written through to the shared disk tier, when one is configured.
+
+Results are never shared between credentials: a cached bucket is only
+served to the tenant whose token fetched it, so a caller can't read another
+tenant's feasibility results (or skip Canopy's authorization) by sending an
+arbitrary token.
+"""
+
+import hashlib
+import logging
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+from geojson_pydantic import Point
+
+from stapi_fastapi_umbra.codec import adapter
+from stapi_fastapi_umbra.models import SpotlightConstraints, UmbraOpportunity
+from stapi_fastapi_umbra.settings import Settings
+from stapi_fastapi_umbra.store import DiskCache
+
+logger = logging.getLogger(__name__)
+
+# Buckets this far (or further) in the future get the maximum TTL, buckets
+# near the present scale linearly down to the minimum TTL.
+TTL_HORIZON_SECONDS = 7 * 24 * 3600
+
+FeasibilityFetcher = Callable[
+    [SpotlightConstraints, datetime, datetime], Awaitable[list[UmbraOpportunity]]
+]
+
+STORE_NAMESPACE = "feasibility"
+
+opportunities_adapter = adapter(tuple[UmbraOpportunity, ...])
+
+
+@dataclass
+class _Bucket:
+    opportunities: tuple[UmbraOpportunity, ...]
+    expires_at: float
+
+
+class FeasibilityCache:
+    """Time-bucketed cache of Canopy feasibility opportunities"""
+
+    def __init__(
+        self,
+        bucket_seconds: int = 3600,
+        min_ttl: int = 300,
+        max_ttl: int = 6 * 3600,
+        coordinate_precision: int = 3,
+        max_buckets: int = 100_000,
+        store: DiskCache | None = None,
+    ) -> None:
+        self.bucket_seconds = bucket_seconds
+        self.min_ttl = min_ttl
+        self.max_ttl = max_ttl
+        self.coordinate_precision = coordinate_precision
+        self.max_buckets = max_buckets
+        self.store = store
+        self._buckets: dict[tuple[str, int], _Bucket] = {}
+
+    @classmethod
+    def from_settings(
+        cls, settings: Settings, store: DiskCache | None = None
+    ) -> "FeasibilityCache":
+        return cls(
+            bucket_seconds=settings.feasibility_cache_bucket_seconds,
+            min_ttl=settings.feasibility_cache_min_ttl,
+            max_ttl=settings.feasibility_cache_max_ttl,
+            coordinate_precision=settings.feasibility_cache_coordinate_precision,
+            store=store,
+        )
+
+    def quantize(self, constraints: SpotlightConstraints) -> SpotlightConstraints:
+        """Snap the constraint geometry onto the cache grid"""
+        lon, lat = constraints.geometry.coordinates[:2]
+        geometry = Point(
+            type="Point",
+            coordinates=(
+                round(lon, self.coordinate_precision),
+                round(lat, self.coordinate_precision),
+            ),
+        )
+        return constraints.model_copy(update={"geometry": geometry})
+
+    def key(self, constraints: SpotlightConstraints, tenant: str) -> str:
+        content = f"{tenant}\n{constraints.model_dump_json()}"
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    def ttl(self, bucket: int, now: float) -> float:
+        lead = bucket * self.bucket_seconds - now
+        fraction = min(max(lead / TTL_HORIZON_SECONDS, 0.0), 1.0)
+        return self.min_ttl + (self.max_ttl - self.min_ttl) * fraction
+
+    def _bucket_range(self, start: datetime, end: datetime) -> range:
+        first = int(start.timestamp() // self.bucket_seconds)
+        last = int(-(-end.timestamp() // self.bucket_seconds))
+        return range(first, last)
+
+    def _bucket_start(self, bucket: int) -> datetime:
+        return datetime.fromtimestamp(bucket * self.bucket_seconds, tz=timezone.utc)
+
+    def _bucket_of(self, opportunity: UmbraOpportunity) -> int:
+        return int(opportunity.windowStartAt.timestamp() // self.bucket_seconds)
+
+    async def _lookup(self, key: str, buckets: range, now: float) -> dict[int, _Bucket]:
+        """Cached buckets from memory, falling back to one disk tier lookup"""
+        found: dict[int, _Bucket] = {}
+        for bucket in buckets:
+            entry = self._buckets.get((key, bucket))
+            if entry is not None and entry.expires_at <= now:
+                del self._buckets[(key, bucket)]
+                entry = None
+            if entry is not None:
+                found[bucket] = entry
+
+        missing = [bucket for bucket in buckets if bucket not in found]
+        if missing and self.store is not None:
+            stored = await self.store.read(
+                STORE_NAMESPACE, [f"{key}:{bucket}" for bucket in missing]
+            )
+            for bucket in missing:
+                entry = stored.get(f"{key}:{bucket}")
+                if entry is not None:
+                    found[bucket] = self._buckets[(key, bucket)] = _Bucket(
+                        opportunities=opportunities_adapter.validate_json(entry.value),
+                        expires_at=entry.expires_at,
+                    )
+        return found
+
+    async def _store(
+        self, key: str, buckets: range, opportunities: list[UmbraOpportunity], now: float
+    ) -> list[UmbraOpportunity]:
+        grouped: dict[int, list[UmbraOpportunity]] = {b: [] for b in buckets}
+        for o in opportunities:
+            bucket = self._bucket_of(o)
+            if bucket in grouped:
+                grouped[bucket].append(o)
+        stored = []
+        for bucket, opps in grouped.items():
+            ttl = self.ttl(bucket, now)
+            self._buckets[(key, bucket)] = _Bucket(
+                opportunities=tuple(opps), expires_at=now + ttl
+            )
+            stored.append((f"{key}:{bucket}", opportunities_adapter.dump_json(tuple(opps)), ttl))
+        if self.store is not None and stored:
+            await self.store.write(STORE_NAMESPACE, stored)
+        if len(self._buckets) > self.max_buckets:
+            self._evict(now)
+        return [o for opps in grouped.values() for o in opps]
+
+    def _evict(self, now: float) -> None:
+        expired = [k for k, v in self._buckets.items() if v.expires_at <= now]
+        for k in expired:
+            del self._buckets[k]
+        overflow = len(self._buckets) - self.max_buckets
+        if overflow > 0:
+            oldest = sorted(self._buckets, key=lambda k: self._buckets[k].expires_at)
+            for k in oldest[:overflow]:
+                del self._buckets[k]
+
+    @staticmethod
+    def _runs(buckets: list[int]) -> list[range]:
+        """Contiguous runs of an ascending list of buckets"""
+        runs: list[range] = []
+        for bucket in buckets:
+            if runs and runs[-1].stop == bucket:
+                runs[-1] = range(runs[-1].start, bucket + 1)
+            else:
+                runs.append(range(bucket, bucket + 1))
+        return runs
+
+    async def get_opportunities(
+        self,
+        constraints: SpotlightConstraints,
+        start: datetime,
+        end: datetime,
+        fetch: FeasibilityFetcher,
+        tenant: str,
+    ) -> list[UmbraOpportunity]:
+        """
+        Return the opportunities starting within [start, end), calling `fetch`
+        only for the bucket-aligned sub-intervals missing from `tenant`'s
+        cached buckets.
+        """
+        constraints = self.quantize(constraints)
+        key = self.key(constraints, tenant)
+        buckets = self._bucket_range(start, end)
+
+        cached = await self._lookup(key, buckets, time.time())
+        candidates = [o for entry in cached.values() for o in entry.opportunities]
+        missing = [bucket for bucket in buckets if bucket not in cached]
+
+        for run in self._runs(missing):
+            run_start = self._bucket_start(run.start)
+            run_end = self._bucket_start(run.stop)
+            # The first bucket usually starts before the requested window (and
+            # may be in the past); it is fetched from `start` only, so it isn't
+            # complete and must not be cached.
+            fetch_start = max(run_start, start)
+            logger.debug(f"feasibility cache miss for {fetch_start}/{run_end}")
+            opportunities = await fetch(constraints, fetch_start, run_end)
+            complete = run if fetch_start == run_start else run[1:]
+            candidates.extend(await self._store(key, complete, opportunities, time.time()))
+            if complete is not run:
+                candidates.extend(o for o in opportunities if self._bucket_of(o) == run.start)
+
+        merged = [o for o in candidates if start <= o.windowStartAt < end]
+        merged.sort(key=lambda o: o.windowStartAt)
+        return merged
+
+    def clear(self) -> None:
+        self._buckets.clear()
@@ -1,106 +1,353 @@
 import asyncio
+import hashlib
 import json
 import logging
+import time
+from collections import OrderedDict
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from datetime import datetime
 from uuid import UUID
 
 import httpx
-from stapi_fastapi.models.opportunity import Opportunity, OpportunityRequest
+from stapi_fastapi.models.opportunity import OpportunityRequest
 from stapi_fastapi.models.order import Order
 
-from stapi_fastapi_umbra.models import FeasibilityResponse, TaskResponse
+from stapi_fastapi_umbra import deadline
+from stapi_fastapi_umbra.cache import FeasibilityCache
+from stapi_fastapi_umbra.codec import (
+    JSON_CONTENT_TYPE,
+    decode,
+    encode,
+    encode_json,
+    read_status,
+)
+from stapi_fastapi_umbra.metrics import metrics
+from stapi_fastapi_umbra.models import (
+    FeasibilityRequest,
+    FeasibilityResponse,
+    FeasibilityStatus,
+    ImagingMode,
+    SpotlightConstraints,
+    TaskResponse,
+    UmbraOpportunity,
+)
 from stapi_fastapi_umbra.opportunities import (
-    feasibility_response_to_opportunity_list,
     opportunity_request_to_feasibility_request,
     opportunity_request_to_task_request,
-    stac_item_to_opportunity,
+    stac_items_to_opportunity_set,
     task_response_to_order,
+    umbra_opportunities_to_opportunity_set,
 )
+from stapi_fastapi_umbra.opportunity_set import OpportunitySet
+from stapi_fastapi_umbra.prescreen import Prescreener
+from stapi_fastapi_umbra.scheduler import FairScheduler
 from stapi_fastapi_umbra.settings import CANOPY_API_URL, Settings
+from stapi_fastapi_umbra.store import DiskCache
 
 settings = Settings.load()
 logger = logging.getLogger()
 
+# Shared by every Client so cached results outlive a single request. The disk
+# tier is additionally shared across workers and restarts.
+disk_cache = DiskCache.from_settings(settings)
+feasibility_cache = FeasibilityCache.from_settings(settings, store=disk_cache)
+prescreener = Prescreener.from_settings(settings)
+
+
+# The method, URL and body of an archive search page request
+ArchiveRequest = tuple[str, str, dict | None]
+
 
 class AuthorizationError(Exception):
     pass
 
 
+def archive_request(search: OpportunityRequest, page_size: int | None = None) -> ArchiveRequest:
+    """The request for the first page of the archive search for `search`"""
+    request_payload = {"filter-lang": "cql2-json", **search.model_dump()}
+    if page_size is not None:
+        request_payload["limit"] = page_size
+
+    # SearchOpportunity requires a `geometry` field, but the Canopy API archive/search
+    # route uses an optional 'intersects' field.
+    request_payload["intersects"] = request_payload.pop("geometry")
+    return "POST", f"{CANOPY_API_URL}/archive/search", request_payload
+
+
+def next_archive_request(page: dict, previous: ArchiveRequest) -> ArchiveRequest | None:
+    """The request for the page after `page`, from its STAC `next` link"""
+    next_link = next(
+        (link for link in page.get("links", []) if link.get("rel") == "next"), None
+    )
+    if next_link is None:
+        return None
+    body = next_link.get("body")
+    if next_link.get("merge"):
+        body = {**(previous[2] or {}), **(body or {})}
+    return next_link.get("method", "GET").upper(), next_link["href"], body
+
+
+def tenant_id(canopy_token: str | None) -> str:
+    """Stable, non-reversible identifier for a Canopy credential"""
+    if not canopy_token:
+        return "anonymous"
+    return f"tenant-{hashlib.sha256(canopy_token.encode()).hexdigest()[:12]}"
+
+
+@dataclass
+class _Pool:
+    client: httpx.AsyncClient
+    # The credential's slot budget, one per connection
+    slots: asyncio.Semaphore
+    # Requests in flight on the pool, or waiting for one of its slots
+    active: int = 0
+    evicted: bool = False
+
+
+class ClientPools:
+    """
+    One httpx connection pool, with its own slot budget, per credential, for
+    at most `max_credentials` credentials. The least recently used pool is
+    evicted when a new credential arrives, and closed as soon as no request
+    is using it.
+    """
+
+    def __init__(self, max_connections: int, max_credentials: int) -> None:
+        self.max_connections = max_connections
+        self.max_credentials = max_credentials
+        self.transport: httpx.AsyncBaseTransport | None = None
+        self._pools: OrderedDict[str, _Pool] = OrderedDict()
+
+    @asynccontextmanager
+    async def client(self, tenant: str) -> AsyncIterator[httpx.AsyncClient]:
+        """
+        The pool for `tenant` once one of its slots is free, kept open until
+        the caller is done with it
+        """
+        pool = self._pools.get(tenant)
+        if pool is None:
+            pool = _Pool(
+                httpx.AsyncClient(
+                    limits=httpx.Limits(
+                        max_connections=self.max_connections,
+                        max_keepalive_connections=self.max_connections,
+                    ),
+                    transport=self.transport,
+                ),
+                asyncio.Semaphore(self.max_connections),
+            )
+            self._pools[tenant] = pool
+        self._pools.move_to_end(tenant)
+        pool.active += 1
+        try:
+            await self._evict()
+            async with pool.slots:
+                yield pool.client
+        finally:
+            pool.active -= 1
+            if pool.evicted and pool.active == 0:
+                await pool.client.aclose()
+
+    async def _evict(self) -> None:
+        # Pools with requests in flight are closed by the last of them.
+        while len(self._pools) > self.max_credentials:
+            _, pool = self._pools.popitem(last=False)
+            pool.evicted = True
+            if pool.active == 0:
+                await pool.client.aclose()
+
+    async def aclose(self) -> None:
+        for pool in self._pools.values():
+            await pool.client.aclose()
+        self._pools.clear()
+
+
+pools = ClientPools(
+    max_connections=settings.canopy_connections_per_credential,
+    max_credentials=settings.canopy_max_credentials,
+)
+scheduler = FairScheduler(
+    concurrency=settings.canopy_max_concurrency, weights=settings.canopy_tenant_weights
+)
+
+
 class Client:
     def __init__(self, canopy_api_url: str, canopy_token: str | None) -> None:
         self.canopy_api_url = canopy_api_url
         self.canopy_token = canopy_token
+        self.tenant = tenant_id(canopy_token)
+
+    async def _request(
+        self,
+        method: str,
+        url: str,
+        authenticated: bool = True,
+        content: bytes | None = None,
+        **kwargs,
+    ) -> httpx.Response:
+        # Every upstream call first waits for a slot in the caller's own
+        # connection pool, then is ordered against other callers by the fair
+        # scheduler, and is bounded by the request's deadline. A caller that
+        # has saturated its own pool so holds no global slots it can't use.
+        # Bodies are sent pre-encoded, see `codec`.
+
+        seconds_left = deadline.check()
+        if seconds_left is not None:
+            kwargs["timeout"] = httpx.Timeout(seconds_left)
+        headers = {"Authorization": f"Bearer {self.canopy_token}"} if authenticated else {}
+        if content is not None:
+            headers["Content-Type"] = JSON_CONTENT_TYPE
+            kwargs["content"] = content
+        started = time.perf_counter()
+        try:
+            async with pools.client(self.tenant) as http, scheduler.slot(self.tenant):
+                response = await http.request(method, url, headers=headers, **kwargs)
+        except httpx.TimeoutException as err:
+            # Reported like any other deadline, as a 504 rather than a 500.
+            raise TimeoutError(f"Canopy did not respond in time: {method} {url}") from err
+        metrics.observe_latency(self.tenant, time.perf_counter() - started)
+        response.raise_for_status()
+        return response
 
     async def get_opportunities_from_archive(
         self,
         search: OpportunityRequest,
-    ) -> list[Opportunity]:
-        # Gets opportunities from the archive. Only point geometry searches
-        # are supported for now.
-
-        request_payload = {"filter-lang": "cql2-json", **search.model_dump()}
-
-        # SearchOpportunity requires a `geometry` field, but the Canopy API archive/search
-        # route uses an optional 'intersects' field.
-        request_payload["intersects"] = request_payload.pop("geometry")
-
-        archive_url = f"{CANOPY_API_URL}/archive/search"
-        res = httpx.post(url=archive_url, json=request_payload)
-        res.raise_for_status()
-        opportunities = [
-            stac_item_to_opportunity(o, product_id=search.product_id)
-            for o in res.json()["features"]
-        ]
-        return opportunities
+    ) -> OpportunitySet:
+        # Gets opportunities from the first page of the archive search. Only
+        # point geometry searches are supported for now. Paginated searches
+        # fetch later pages with `get_archive_page` as their cursor advances.
+
+        page = await self.get_archive_page(archive_request(search))
+        return stac_items_to_opportunity_set(page["features"], product_id=search.product_id)
+
+    async def get_archive_page(self, archive: ArchiveRequest, cache: bool = True) -> dict:
+        """The archive search page (a STAC ItemCollection) for `archive`"""
+        return json.loads(await self.get_archive_page_content(archive, cache))
+
+    async def get_archive_page_content(
+        self, archive: ArchiveRequest, cache: bool = True
+    ) -> bytes:
+        """The archive search page for `archive`, as the JSON bytes Canopy sent"""
+        method, url, body = archive
+        return await self._archive_page(method, url, body, cache)
+
+    async def _archive_page(
+        self, method: str, url: str, body: dict | None, cache: bool = True
+    ) -> bytes:
+        cache = cache and disk_cache is not None
+        cache_key = hashlib.sha256(
+            json.dumps([method, url, body], sort_keys=True, default=str).encode()
+        ).hexdigest()
+        cached = await disk_cache.read("archive", [cache_key]) if cache else {}
+        if cache_key in cached:
+            return cached[cache_key].value
+
+        res = await self._request(
+            method,
+            url,
+            authenticated=False,
+            content=encode_json(body) if body is not None else None,
+        )
+        if cache:
+            await disk_cache.write(
+                "archive", [(cache_key, res.content, settings.archive_cache_ttl)]
+            )
+        return res.content
 
     async def get_opportunities_from_feasibility(
         self,
         search: OpportunityRequest,
-    ) -> list[Opportunity]:
+    ) -> OpportunitySet:
         # Gets opportunities from feasibility. Only point geometry searches
         # are supported.
 
+        return umbra_opportunities_to_opportunity_set(
+            await self.get_feasibility_opportunities(search),
+            geometry=search.geometry,
+            product_id=search.product_id,
+        )
+
+    async def get_feasibility_opportunities(
+        self, search: OpportunityRequest
+    ) -> list[UmbraOpportunity]:
+        """Canopy's feasibility opportunities for `search`, through the cache"""
         if not self.canopy_token:
             raise AuthorizationError(
                 "Time range requested includes future opportunities, canopy_token is required"
             )
 
-        headers = {"Authorization": f"Bearer {self.canopy_token}"}
-
         payload = opportunity_request_to_feasibility_request(search)
-        payload_to_send = payload.model_dump_json()
+        return await feasibility_cache.get_opportunities(
+            payload.spotlightConstraints,
+            payload.windowStartAt,
+            payload.windowEndAt,
+            self._fetch_feasibility,
+            self.tenant,
+        )
+
+    async def _fetch_feasibility(
+        self,
+        constraints: SpotlightConstraints,
+        window_start: datetime,
+        window_end: datetime,
+    ) -> list[UmbraOpportunity]:
+        # Narrows the window to the locally pre-screened access intervals, if
+        # pre-screening is configured, and skips Canopy when there are none.
+
+        windows = None
+        if prescreener is not None:
+            windows = prescreener.candidate_intervals(constraints, window_start, window_end)
+        if windows is None:
+            windows = [(window_start, window_end)]
+        elif not windows:
+            logger.info("no access in feasibility window, skipping canopy request")
+
+        opportunities = []
+        for start, end in windows:
+            opportunities.extend(await self._request_feasibility(constraints, start, end))
+        return opportunities
+
+    async def _request_feasibility(
+        self,
+        constraints: SpotlightConstraints,
+        window_start: datetime,
+        window_end: datetime,
+    ) -> list[UmbraOpportunity]:
+        # Runs a single Canopy feasibility job for the window and waits for it
+        # to complete.
+
+        payload = FeasibilityRequest(
+            imagingMode=ImagingMode.SPOTLIGHT,
+            spotlightConstraints=constraints,
+            windowStartAt=window_start,
+            windowEndAt=window_end,
+        )
 
         feasibility_url = f"{self.canopy_api_url}/tasking/feasibilities"
-        feasibility_post = httpx.post(
-            url=feasibility_url,
-            json=json.loads(payload_to_send),
-            headers=headers,
+        feasibility_post = await self._request(
+            "POST", feasibility_url, content=encode(payload)
         )
 
-        feasibility_post.raise_for_status()
-        request_id = feasibility_post.json()["id"]
+        request_id = decode(FeasibilityStatus, feasibility_post.content).id
         i = 0
-        while i <= settings.feasibility_timeout:
-            feasibility_get = httpx.get(
-                url=f"{feasibility_url}/{request_id}",
-                headers=headers,
-            )
-            feasibility_get.raise_for_status()
-            feasibility_status = feasibility_get.json()["status"]
+        while True:
+            feasibility_get = await self._request("GET", f"{feasibility_url}/{request_id}")
+            feasibility_status = read_status(feasibility_get.content)
 
             if feasibility_status == "COMPLETED":
                 break
-            await asyncio.sleep(1)
+            i += 1
+            if i > settings.feasibility_timeout:
+                raise TimeoutError(f"feasibility request {request_id} did not complete")
+            seconds_left = deadline.check()
+            await asyncio.sleep(1 if seconds_left is None else min(1, seconds_left))
 
-        feasibility_response = FeasibilityResponse.model_validate(
-            feasibility_get.json()
-        )
-        opportunities = feasibility_response_to_opportunity_list(
-            feasibility_response, product_id=search.product_id
-        )
-
-        return opportunities
+        feasibility_response = decode(FeasibilityResponse, feasibility_get.content)
+        return feasibility_response.opportunities
 
-    def create_order_from_opportunity_request(
+    async def create_order_from_opportunity_request(
         self, search: OpportunityRequest
     ) -> Order:
         if not self.canopy_token:
@@ -108,41 +355,32 @@ class Client:
                 "Time range requested includes future opportunities, canopy_token is required"
             )
 
-        headers = {"Authorization": f"Bearer {self.canopy_token}"}
-
         payload = opportunity_request_to_task_request(search)
-        payload_to_send = payload.model_dump_json()
+        payload_to_send = encode(payload)
 
-        logger.info(f"submitting canopy task request: {payload_to_send}")
+        logger.info(f"submitting canopy task request: {payload_to_send.decode()}")
 
         tasking_url = f"{self.canopy_api_url}/tasking/tasks"
-        response = httpx.post(
-            url=tasking_url,
-            json=json.loads(payload_to_send),
-            headers=headers,
-        )
-        response.raise_for_status()
+        response = await self._request("POST", tasking_url, content=payload_to_send)
 
-        task_response = TaskResponse.model_validate(response.json())
+        task_response = decode(TaskResponse, response.content)
 
         return task_response_to_order(task_response, search.product_id)
 
-    def get_order_by_id(self, order_id: str) -> Order:
+    async def get_order_by_id(self, order_id: str) -> Order:
+        task_response = await self.get_task(order_id)
+        return task_response_to_order(task_response, "umbra_spotlight")
+
+    async def get_task(self, order_id: str) -> TaskResponse:
         if not self.canopy_token:
             raise AuthorizationError(
                 "Time range requested includes future opportunities, canopy_token is required"
             )
 
-        headers = {"Authorization": f"Bearer {self.canopy_token}"}
         try:
             task_id = UUID(order_id)
         except Exception:
             raise ValueError("order_id must be a valid UUID")
-        task_url = f"{settings.canopy_api_url}/tasking/tasks/{task_id}"
-        response = httpx.get(
-            url=task_url,
-            headers=headers,
-        )
-        response.raise_for_status()
-        task_response = TaskResponse.model_validate(response.json())
-        return task_response_to_order(task_response, "umbra_spotlight")
+        task_url = f"{self.canopy_api_url}/tasking/tasks/{task_id}"
+        response = await self._request("GET", task_url)
+        return decode(TaskResponse, response.content)
@@ -0,0 +1,45 @@
+"""Encoding and decoding of Canopy request and response bodies
+
+Requests are sent as the bytes produced by pydantic's JSON serializer and
+responses are validated straight from the raw bytes, instead of going
+through intermediate `dict`s that httpx and pydantic each re-encode or
+re-parse.
+"""
+
+import json
+from functools import cache
+from typing import Any, TypeVar
+
+from pydantic import BaseModel, TypeAdapter
+
+T = TypeVar("T")
+
+JSON_CONTENT_TYPE = "application/json"
+
+
+class _Status(BaseModel):
+    """Just the status of a job; other members are parsed but not validated"""
+
+    status: str | None = None
+
+
+@cache
+def adapter(type_: type[T]) -> TypeAdapter[T]:
+    return TypeAdapter(type_)
+
+
+def encode(model: BaseModel) -> bytes:
+    return model.model_dump_json().encode()
+
+
+def encode_json(obj: Any) -> bytes:
+    return json.dumps(obj, separators=(",", ":"), default=str).encode()
+
+
+def decode(type_: type[T], content: bytes) -> T:
+    return adapter(type_).validate_json(content)
+
+
+def read_status(content: bytes) -> str | None:
+    """The top-level `status` member of a JSON object, ignoring nested ones"""
+    return decode(_Status, content).status
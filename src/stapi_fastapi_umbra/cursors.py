@@ -0,0 +1,112 @@
+"""Result cursors for paginated opportunity searches
+
+A cursor names where the next page of a search starts: the backend's own
+position state (e.g. the archive page and offset it stopped at) and the page
+size, so each page only fetches what it returns. Position values that are
+bytes, such as upstream results the later pages are cut from, are kept with
+the cursor, so those pages don't fetch them again while it lives. Cursors
+are kept in the shared disk tier when one is configured, so any worker can
+serve the next page, and in a bounded in-memory LRU otherwise.
+
+A cursor is only valid for the credential and search body that created it;
+anything else is told the cursor doesn't exist.
+"""
+
+import json
+import secrets
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, replace
+
+from stapi_fastapi_umbra.settings import Settings
+from stapi_fastapi_umbra.store import DiskCache
+
+STORE_NAMESPACE = "cursors"
+
+
+class CursorNotFound(Exception):
+    pass
+
+
+@dataclass
+class Cursor:
+    # Hash of the caller's credential
+    owner: str
+    # Hash of the search body
+    search: str
+    limit: int
+    position: dict
+
+
+@dataclass
+class _Entry:
+    cursor: Cursor
+    expires_at: float
+
+
+class CursorStore:
+    """TTL'd store of cursors addressed by opaque tokens"""
+
+    def __init__(
+        self, ttl: float = 900, max_entries: int = 256, store: DiskCache | None = None
+    ) -> None:
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.store = store
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+
+    @classmethod
+    def from_settings(cls, settings: Settings, store: DiskCache | None = None) -> "CursorStore":
+        return cls(ttl=settings.cursor_ttl, max_entries=settings.cursor_max_entries, store=store)
+
+    async def put(self, cursor: Cursor) -> str:
+        """Store `cursor`, returning its token"""
+        token = secrets.token_urlsafe(16)
+        if self.store is not None:
+            # Bytes in the position are stored as entries of their own,
+            # next to the cursor, rather than escaped into its JSON.
+            blobs = {k: v for k, v in cursor.position.items() if isinstance(v, bytes)}
+            position = {k: v for k, v in cursor.position.items() if k not in blobs}
+            value = json.dumps(
+                {**asdict(replace(cursor, position=position)), "blobs": list(blobs)}, default=str
+            ).encode()
+            await self.store.write(
+                STORE_NAMESPACE,
+                [(token, value, self.ttl)]
+                + [(f"{token}:{k}", v, self.ttl) for k, v in blobs.items()],
+            )
+            return token
+
+        self._entries[token] = _Entry(cursor, time.time() + self.ttl)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return token
+
+    async def get(self, token: str, owner: str, search: str) -> Cursor:
+        """The cursor for `token`, if it was created by `owner` for `search`"""
+        cursor = await self._load(token)
+        if cursor is None or cursor.owner != owner or cursor.search != search:
+            raise CursorNotFound("cursor not found or expired")
+        return cursor
+
+    async def _load(self, token: str) -> Cursor | None:
+        if self.store is not None:
+            stored = await self.store.read(STORE_NAMESPACE, [token])
+            if token not in stored:
+                return None
+            fields = json.loads(stored[token].value)
+            blobs = fields.pop("blobs", [])
+            if blobs:
+                keys = [f"{token}:{k}" for k in blobs]
+                stored = await self.store.read(STORE_NAMESPACE, keys)
+                if len(stored) < len(keys):
+                    return None
+                fields["position"].update((k, stored[f"{token}:{k}"].value) for k in blobs)
+            return Cursor(**fields)
+
+        entry = self._entries.get(token)
+        if entry is None or entry.expires_at <= time.time():
+            self._entries.pop(token, None)
+            return None
+        self._entries.move_to_end(token)
+        return entry.cursor
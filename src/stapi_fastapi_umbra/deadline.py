@@ -0,0 +1,121 @@
+"""Request-scoped deadlines for upstream Canopy work
+
+A deadline is taken from the caller's `Request-Timeout` header (seconds) or
+the route's default, and stored in a context variable so that every
+`Client` call and poll iteration made on behalf of the request can bound
+itself by the time remaining. The work is cancelled as soon as the deadline
+passes or the caller disconnects.
+"""
+
+import asyncio
+import logging
+import math
+import time
+from collections.abc import Awaitable
+from contextvars import ContextVar
+from typing import TypeVar
+
+from fastapi import Request
+
+from stapi_fastapi_umbra.metrics import metrics
+
+T = TypeVar("T")
+
+REQUEST_TIMEOUT_HEADER = "Request-Timeout"
+DISCONNECT_POLL_SECONDS = 0.5
+
+logger = logging.getLogger(__name__)
+
+current_deadline: ContextVar[float | None] = ContextVar("current_deadline", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+class ClientDisconnected(Exception):
+    pass
+
+
+def remaining() -> float | None:
+    """Seconds left before the current deadline, or `None` if there is none"""
+    deadline = current_deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def check() -> float | None:
+    """Like `remaining`, but raises `DeadlineExceeded` once it has passed"""
+    seconds = remaining()
+    if seconds is not None and seconds <= 0:
+        raise DeadlineExceeded("request deadline exceeded")
+    return seconds
+
+
+def request_timeout(request: Request, default: float, maximum: float) -> float:
+    """The caller's requested timeout, bounded by `maximum`, or `default`"""
+    header = request.headers.get(REQUEST_TIMEOUT_HEADER)
+    if header is None:
+        return default
+    try:
+        seconds = float(header)
+    except ValueError:
+        return default
+    if not math.isfinite(seconds):
+        # float() accepts "nan", which would slip past the bounds below.
+        return default
+    return min(max(seconds, 0.0), maximum)
+
+
+async def _wait_for_disconnect(request: Request) -> None:
+    while not await request.is_disconnected():
+        await asyncio.sleep(DISCONNECT_POLL_SECONDS)
+
+
+async def run_with_deadline(
+    request: Request, work: Awaitable[T], timeout: float, tenant: str
+) -> T:
+    """
+    Run `work` under a deadline `timeout` seconds from now (or the enclosing
+    deadline, if sooner), cancelling it on expiry or client disconnect.
+    """
+    deadline = time.monotonic() + timeout
+    enclosing = current_deadline.get()
+    if enclosing is not None:
+        deadline = min(deadline, enclosing)
+
+    # The task copies the context when it is created, so set the deadline first.
+    token = current_deadline.set(deadline)
+    try:
+        task = asyncio.ensure_future(work)
+    finally:
+        current_deadline.reset(token)
+    watcher = asyncio.create_task(_wait_for_disconnect(request))
+
+    try:
+        done, _ = await asyncio.wait(
+            {task, watcher},
+            timeout=max(deadline - time.monotonic(), 0),
+            return_when=asyncio.FIRST_COMPLETED,
+        )
+        if task in done:
+            try:
+                return task.result()
+            except DeadlineExceeded:
+                metrics.increment(tenant, "cancelled_deadline")
+                raise
+
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        if watcher in done:
+            metrics.increment(tenant, "cancelled_disconnect")
+            logger.info("caller disconnected, cancelled upstream work")
+            raise ClientDisconnected("client disconnected")
+        metrics.increment(tenant, "cancelled_deadline")
+        raise DeadlineExceeded("request deadline exceeded")
+    finally:
+        watcher.cancel()
+        if not task.done():
+            # We were cancelled ourselves; take the upstream work with us.
+            task.cancel()
@@ -0,0 +1,192 @@
+"""Server-Sent Events for order status
+
+Each process runs at most one poller per active Canopy task (and caller
+credential), however many clients are watching it. Pollers back off while
+the status is unchanged, fan status changes out to every subscriber, and
+stop as soon as the task reaches a terminal status or the last subscriber
+goes away, so upstream load scales with active tasks rather than clients.
+"""
+
+import asyncio
+import contextvars
+import json
+import logging
+from collections.abc import AsyncIterator
+
+import httpx
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+
+from stapi_fastapi_umbra.client import Client
+from stapi_fastapi_umbra.opportunities import task_response_to_order
+from stapi_fastapi_umbra.settings import Settings
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = {"DELIVERED", "REJECTED", "CANCELED", "EXPIRED", "FAILED"}
+
+# (task id, event) pairs; an event of None marks the end of that task's stream.
+Subscriber = asyncio.Queue[tuple[str, dict | None]]
+
+
+def format_event(event: dict) -> str:
+    return f"event: status\nid: {event['id']}\ndata: {json.dumps(event)}\n\n"
+
+
+class TaskPoller:
+    """Polls a single Canopy task and fans its status changes out"""
+
+    def __init__(
+        self,
+        client: Client,
+        task_id: str,
+        min_interval: float,
+        max_interval: float,
+        backoff: float,
+    ) -> None:
+        self.client = client
+        self.task_id = task_id
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.subscribers: set[Subscriber] = set()
+        self.last_event: dict | None = None
+        self.finished = False
+        self.task: asyncio.Task | None = None
+
+    def _publish(self, event: dict | None) -> None:
+        for subscriber in self.subscribers:
+            subscriber.put_nowait((self.task_id, event))
+
+    async def _poll(self) -> dict:
+        task_response = await self.client.get_task(self.task_id)
+        order = task_response_to_order(task_response, "umbra_spotlight")
+        return {
+            "id": self.task_id,
+            "status": task_response.properties.status,
+            "order": jsonable_encoder(order, exclude_unset=True),
+        }
+
+    async def run(self) -> None:
+        interval = self.min_interval
+        try:
+            while self.subscribers:
+                try:
+                    event = await self._poll()
+                except httpx.HTTPStatusError as err:
+                    if err.response.is_client_error:
+                        # Not found or not allowed; polling again won't help.
+                        self._publish(
+                            {"id": self.task_id, "error": err.response.reason_phrase}
+                        )
+                        break
+                    logger.warning(f"failed to poll task {self.task_id}: {err}")
+                    interval = min(interval * self.backoff, self.max_interval)
+                except Exception:
+                    logger.exception(f"failed to poll task {self.task_id}")
+                    interval = min(interval * self.backoff, self.max_interval)
+                else:
+                    if self.last_event is None or event["status"] != self.last_event["status"]:
+                        self.last_event = event
+                        self._publish(event)
+                        interval = self.min_interval
+                    else:
+                        interval = min(interval * self.backoff, self.max_interval)
+                    if event["status"] in TERMINAL_STATUSES:
+                        break
+                await asyncio.sleep(interval)
+        finally:
+            self.finished = True
+            self._publish(None)
+
+
+class TaskEvents:
+    """Registry of the task pollers shared by all subscribers in the process"""
+
+    def __init__(
+        self,
+        min_interval: float = 2.0,
+        max_interval: float = 60.0,
+        backoff: float = 1.5,
+        keepalive: float = 15.0,
+    ) -> None:
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.keepalive = keepalive
+        self._pollers: dict[tuple[str, str], TaskPoller] = {}
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "TaskEvents":
+        return cls(
+            min_interval=settings.order_events_min_interval,
+            max_interval=settings.order_events_max_interval,
+            backoff=settings.order_events_backoff,
+            keepalive=settings.order_events_keepalive,
+        )
+
+    def subscribe(self, client: Client, task_id: str, subscriber: Subscriber) -> None:
+        # Pollers are per credential as well as per task, so a caller only
+        # ever sees tasks their own token can read.
+        key = (client.tenant, task_id)
+        poller = self._pollers.get(key)
+        if poller is None or poller.finished:
+            poller = TaskPoller(
+                client, task_id, self.min_interval, self.max_interval, self.backoff
+            )
+            self._pollers[key] = poller
+            poller.subscribers.add(subscriber)
+            # Start from an empty context so the poller doesn't inherit the
+            # deadline of the request that happened to create it.
+            poller.task = asyncio.get_running_loop().create_task(
+                poller.run(), context=contextvars.Context()
+            )
+            poller.task.add_done_callback(lambda _: self._remove(key, poller))
+        else:
+            poller.subscribers.add(subscriber)
+            if poller.last_event is not None:
+                subscriber.put_nowait((task_id, poller.last_event))
+
+    def unsubscribe(self, client: Client, task_id: str, subscriber: Subscriber) -> None:
+        poller = self._pollers.get((client.tenant, task_id))
+        if poller is None:
+            return
+        poller.subscribers.discard(subscriber)
+        if not poller.subscribers and poller.task is not None:
+            poller.finished = True
+            poller.task.cancel()
+
+    def _remove(self, key: tuple[str, str], poller: TaskPoller) -> None:
+        if self._pollers.get(key) is poller:
+            del self._pollers[key]
+
+    async def stream(
+        self, client: Client, task_ids: list[str], request: Request
+    ) -> AsyncIterator[str]:
+        """Server-Sent Events for the tasks until all are terminal or the caller leaves"""
+        task_ids = list(dict.fromkeys(task_ids))
+        subscriber: Subscriber = asyncio.Queue()
+        for task_id in task_ids:
+            self.subscribe(client, task_id, subscriber)
+
+        open_tasks = set(task_ids)
+        try:
+            while open_tasks:
+                try:
+                    task_id, event = await asyncio.wait_for(
+                        subscriber.get(), timeout=self.keepalive
+                    )
+                except TimeoutError:
+                    if await request.is_disconnected():
+                        return
+                    yield ": keepalive\n\n"
+                    continue
+                if event is None:
+                    open_tasks.discard(task_id)
+                elif "error" in event:
+                    yield f"event: error\nid: {task_id}\ndata: {json.dumps(event)}\n\n"
+                else:
+                    yield format_event(event)
+        finally:
+            for task_id in task_ids:
+                self.unsubscribe(client, task_id, subscriber)
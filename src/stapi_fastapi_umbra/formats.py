@@ -0,0 +1,310 @@
+"""Columnar encodings of opportunity sets
+
+Large result sets can be requested as an Arrow IPC stream, GeoParquet or
+MessagePack instead of GeoJSON. All three are built straight from the
+`OpportunitySet` columns: timestamps, angles and lookup indices are handed
+to Arrow without per-row Python objects, and geometries are encoded to WKB
+once per distinct geometry. Arrow output is written one record batch at a
+time so the response starts before the whole set has been encoded.
+
+pyarrow and msgpack are optional; a format whose library is missing is
+reported as unavailable rather than failing at import.
+"""
+
+import io
+import json
+import struct
+from collections.abc import Iterator
+
+import numpy as np
+
+from stapi_fastapi_umbra.opportunity_set import OpportunitySet
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover
+    pa = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+GEOPARQUET = "application/vnd.apache.parquet"
+MSGPACK = "application/vnd.msgpack"
+
+# Aliases seen in the wild, mapped to the media type we respond with.
+MEDIA_TYPES = {
+    ARROW_STREAM: ARROW_STREAM,
+    GEOPARQUET: GEOPARQUET,
+    "application/x-parquet": GEOPARQUET,
+    MSGPACK: MSGPACK,
+    "application/msgpack": MSGPACK,
+    "application/x-msgpack": MSGPACK,
+}
+GEOJSON_MEDIA_TYPES = {"application/geo+json", "application/json", "application/*", "*/*"}
+
+RECORD_BATCH_SIZE = 10_000
+
+WKB_TYPES = {
+    "Point": 1,
+    "LineString": 2,
+    "Polygon": 3,
+    "MultiPoint": 4,
+    "MultiLineString": 5,
+    "MultiPolygon": 6,
+    "GeometryCollection": 7,
+}
+
+
+class FormatUnavailable(Exception):
+    pass
+
+
+def _quality(params: list[str]) -> float:
+    """The `q` of a media range's parameters; unparseable values exclude it"""
+    for param in params:
+        name, _, value = param.partition("=")
+        if name.strip() == "q":
+            try:
+                return float(value)
+            except ValueError:
+                return 0.0
+    return 1.0
+
+
+def _parse_accept(accept: str) -> list[str]:
+    """The acceptable media ranges in an `Accept` header, most preferred first"""
+    ranges = []
+    for position, item in enumerate(accept.split(",")):
+        media_type, *params = (part.strip() for part in item.split(";"))
+        q = _quality(params)
+        if q > 0:
+            ranges.append((-q, position, media_type.lower()))
+    return [media_type for _, _, media_type in sorted(ranges)]
+
+
+def negotiate(accept: str | None) -> str | None:
+    """
+    The columnar media type preferred by an `Accept` header, or `None` if
+    GeoJSON is preferred or nothing in the header is recognized.
+    """
+    for media_type in _parse_accept(accept or ""):
+        if media_type in MEDIA_TYPES:
+            return MEDIA_TYPES[media_type]
+        if media_type in GEOJSON_MEDIA_TYPES:
+            return None
+    return None
+
+
+def require(media_type: str) -> None:
+    """Raise `FormatUnavailable` if the library for `media_type` isn't installed"""
+    if media_type in (ARROW_STREAM, GEOPARQUET) and pa is None:
+        raise FormatUnavailable(f"install pyarrow to receive {media_type}")
+    if media_type == MSGPACK and msgpack is None:
+        raise FormatUnavailable(f"install msgpack to receive {media_type}")
+
+
+def encode(
+    opportunities: OpportunitySet, media_type: str, batch_size: int = RECORD_BATCH_SIZE
+) -> Iterator[bytes]:
+    """Chunks of `opportunities` encoded as `media_type`"""
+    require(media_type)
+    if media_type == ARROW_STREAM:
+        return _arrow_stream(opportunities, batch_size)
+    if media_type == GEOPARQUET:
+        return iter([_geoparquet(opportunities, batch_size)])
+    if media_type == MSGPACK:
+        return iter([_msgpack(opportunities)])
+    raise ValueError(f"unsupported media type {media_type}")
+
+
+def _wkb(geometry: dict) -> bytes:
+    """Little-endian WKB for a GeoJSON geometry"""
+    kind = geometry["type"]
+    header = struct.pack("<BI", 1, WKB_TYPES[kind])
+    if kind == "GeometryCollection":
+        parts = [_wkb(g) for g in geometry["geometries"]]
+        return header + struct.pack("<I", len(parts)) + b"".join(parts)
+    coordinates = geometry["coordinates"]
+    if kind == "Point":
+        return header + struct.pack("<2d", *coordinates[:2])
+    if kind == "LineString":
+        return header + _ring(coordinates)
+    if kind == "Polygon":
+        return header + _rings(coordinates)
+    member = {"MultiPoint": "Point", "MultiLineString": "LineString", "MultiPolygon": "Polygon"}
+    parts = [_wkb({"type": member[kind], "coordinates": c}) for c in coordinates]
+    return header + struct.pack("<I", len(parts)) + b"".join(parts)
+
+
+def _ring(coordinates: list) -> bytes:
+    points = np.array([c[:2] for c in coordinates], dtype="<f8").reshape(-1, 2)
+    return struct.pack("<I", len(points)) + points.tobytes()
+
+
+def _rings(rings: list) -> bytes:
+    return struct.pack("<I", len(rings)) + b"".join(_ring(r) for r in rings)
+
+
+def _positions(geometry: dict) -> Iterator[list[float]]:
+    def walk(coordinates: list) -> Iterator[list[float]]:
+        if coordinates and isinstance(coordinates[0], (int, float)):
+            yield coordinates[:2]
+        else:
+            for c in coordinates:
+                yield from walk(c)
+
+    if geometry["type"] == "GeometryCollection":
+        for g in geometry["geometries"]:
+            yield from _positions(g)
+    else:
+        yield from walk(geometry["coordinates"])
+
+
+def _bounds(geometries: list[dict]) -> list[float]:
+    points = np.array([p for g in geometries for p in _positions(g)], dtype=np.float64)
+    return [*points.min(axis=0).tolist(), *points.max(axis=0).tolist()]
+
+
+def _schema(geoarrow: bool) -> "pa.Schema":
+    angles = pa.list_(pa.float64(), 2)
+    labels = pa.dictionary(pa.int32(), pa.string())
+    geometry_metadata = (
+        {"ARROW:extension:name": "geoarrow.wkb", "ARROW:extension:metadata": "{}"}
+        if geoarrow
+        else None
+    )
+    return pa.schema(
+        [
+            pa.field("product_id", labels),
+            pa.field("start_datetime", pa.timestamp("us", tz="UTC")),
+            pa.field("end_datetime", pa.timestamp("us", tz="UTC")),
+            pa.field("duration_seconds", pa.float64()),
+            pa.field("grazing_angle_degrees", angles),
+            pa.field("target_azimuth_angle_degrees", angles),
+            pa.field("satellite_id", labels),
+            pa.field("imaging_mode", labels),
+            pa.field("geometry", pa.binary(), metadata=geometry_metadata),
+            pa.field("archive_id", pa.string()),
+            pa.field("order_href", labels),
+        ]
+    )
+
+
+def _record_batches(
+    opportunities: OpportunitySet, schema: "pa.Schema", batch_size: int
+) -> Iterator["pa.RecordBatch"]:
+    def labels(indices: np.ndarray, values: list[str]) -> "pa.DictionaryArray":
+        return pa.DictionaryArray.from_arrays(
+            pa.array(indices, pa.int32()), pa.array(values, pa.string())
+        )
+
+    def angles(pairs: np.ndarray) -> "pa.FixedSizeListArray":
+        return pa.FixedSizeListArray.from_arrays(pa.array(pairs.ravel(), pa.float64()), 2)
+
+    # Encode each distinct geometry and link once; rows just index into them.
+    wkb = pa.array(
+        [_wkb(json.loads(g)) for g in opportunities.geometries], pa.binary()
+    )
+    hrefs = [t.href for t in opportunities.link_templates]
+
+    for offset in range(0, max(len(opportunities), 1), batch_size):
+        batch = opportunities.take(slice(offset, offset + batch_size))
+        yield pa.RecordBatch.from_arrays(
+            [
+                labels(np.zeros(len(batch), dtype=np.int32), [opportunities.product_id]),
+                pa.array(batch.start, pa.timestamp("us", tz="UTC")),
+                pa.array(batch.end, pa.timestamp("us", tz="UTC")),
+                pa.array(batch.duration, pa.float64()),
+                angles(batch.grazing),
+                angles(batch.azimuth),
+                labels(batch.satellite, list(opportunities.satellites)),
+                labels(batch.imaging_mode, list(opportunities.imaging_modes)),
+                wkb.take(pa.array(batch.geometry, pa.int32())),
+                pa.array(batch.item_id, pa.string(), from_pandas=True),
+                labels(batch.link, hrefs),
+            ],
+            schema=schema,
+        )
+
+
+class _Chunks(io.RawIOBase):
+    """Write-only file that hands back whatever was written since the last drain"""
+
+    def __init__(self) -> None:
+        self._chunks: list[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _arrow_stream(opportunities: OpportunitySet, batch_size: int) -> Iterator[bytes]:
+    schema = _schema(geoarrow=True)
+    sink = _Chunks()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        for batch in _record_batches(opportunities, schema, batch_size):
+            writer.write_batch(batch)
+            yield sink.drain()
+    yield sink.drain()
+
+
+def _geoparquet(opportunities: OpportunitySet, batch_size: int) -> bytes:
+    geometries = [json.loads(g) for g in opportunities.geometries]
+    column = {
+        "encoding": "WKB",
+        "geometry_types": sorted({g["type"] for g in geometries}),
+    }
+    if geometries:
+        column["bbox"] = _bounds(geometries)
+    geo = {"version": "1.1.0", "primary_column": "geometry", "columns": {"geometry": column}}
+
+    schema = _schema(geoarrow=False).with_metadata({"geo": json.dumps(geo)})
+    buffer = io.BytesIO()
+    with pq.ParquetWriter(buffer, schema) as writer:
+        for batch in _record_batches(opportunities, schema, batch_size):
+            writer.write_batch(batch)
+    return buffer.getvalue()
+
+
+def _msgpack(opportunities: OpportunitySet) -> bytes:
+    def timestamps(micros: np.ndarray) -> list:
+        seconds, remainder = np.divmod(micros, 1_000_000)
+        return [
+            msgpack.Timestamp(s, us * 1000)
+            for s, us in zip(seconds.tolist(), remainder.tolist())
+        ]
+
+    wkb = [_wkb(json.loads(g)) for g in opportunities.geometries]
+    satellites = opportunities.satellites
+    imaging_modes = opportunities.imaging_modes
+    hrefs = [t.href for t in opportunities.link_templates]
+    return msgpack.packb(
+        {
+            "product_id": opportunities.product_id,
+            "columns": {
+                "start_datetime": timestamps(opportunities.start),
+                "end_datetime": timestamps(opportunities.end),
+                "duration_seconds": opportunities.duration.tolist(),
+                "grazing_angle_degrees": opportunities.grazing.tolist(),
+                "target_azimuth_angle_degrees": opportunities.azimuth.tolist(),
+                "satellite_id": [satellites[i] for i in opportunities.satellite.tolist()],
+                "imaging_mode": [imaging_modes[i] for i in opportunities.imaging_mode.tolist()],
+                "geometry": [wkb[i] for i in opportunities.geometry.tolist()],
+                "archive_id": opportunities.item_id.tolist(),
+                "order_href": [hrefs[i] for i in opportunities.link.tolist()],
+            },
+        },
+        use_bin_type=True,
+    )
@@ -0,0 +1,84 @@
+"""In-process metrics for upstream Canopy calls"""
+
+import math
+from collections import OrderedDict, defaultdict, deque
+from dataclasses import dataclass, field
+
+
+@dataclass
+class _TenantMetrics:
+    latencies: deque[float]
+    queue_depth: int = 0
+    max_queue_depth: int = 0
+    counters: dict[str, int] = field(default_factory=lambda: defaultdict(int))
+
+
+class Metrics:
+    """
+    Per-tenant latency samples, queue depth gauges and counters, for at most
+    `max_tenants` tenants. The least recently seen tenant without queued calls
+    is dropped when a new one arrives.
+    """
+
+    def __init__(self, max_samples: int = 1024, max_tenants: int = 1024) -> None:
+        self.max_samples = max_samples
+        self.max_tenants = max_tenants
+        self._tenants: OrderedDict[str, _TenantMetrics] = OrderedDict()
+
+    def _tenant(self, tenant: str) -> _TenantMetrics:
+        entry = self._tenants.get(tenant)
+        if entry is None:
+            self._evict()
+            entry = _TenantMetrics(latencies=deque(maxlen=self.max_samples))
+            self._tenants[tenant] = entry
+        self._tenants.move_to_end(tenant)
+        return entry
+
+    def _evict(self) -> None:
+        # Makes room for one more tenant. A tenant with queued calls keeps its
+        # gauge until they are dispatched.
+        overflow = len(self._tenants) + 1 - self.max_tenants
+        if overflow <= 0:
+            return
+        idle = [t for t, m in self._tenants.items() if m.queue_depth == 0]
+        for tenant in idle[:overflow]:
+            del self._tenants[tenant]
+
+    def observe_latency(self, tenant: str, seconds: float) -> None:
+        self._tenant(tenant).latencies.append(seconds)
+
+    def queue_changed(self, tenant: str, delta: int) -> None:
+        entry = self._tenant(tenant)
+        entry.queue_depth += delta
+        entry.max_queue_depth = max(entry.max_queue_depth, entry.queue_depth)
+
+    def increment(self, tenant: str, name: str, value: int = 1) -> None:
+        self._tenant(tenant).counters[name] += value
+
+    @staticmethod
+    def percentile(samples: list[float], q: float) -> float | None:
+        if not samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, math.ceil(q * len(ordered)) - 1)]
+
+    def snapshot(self) -> dict[str, dict]:
+        snapshot = {}
+        for tenant in sorted(self._tenants):
+            entry = self._tenants[tenant]
+            samples = list(entry.latencies)
+            snapshot[tenant] = {
+                "requests": len(samples),
+                "latency_p50_seconds": self.percentile(samples, 0.50),
+                "latency_p95_seconds": self.percentile(samples, 0.95),
+                "queue_depth": entry.queue_depth,
+                "max_queue_depth": entry.max_queue_depth,
+                **entry.counters,
+            }
+        return snapshot
+
+    def reset(self) -> None:
+        self._tenants.clear()
+
+
+metrics = Metrics()
@@ -52,6 +52,13 @@ class UmbraOpportunity(BaseModel):
     satelliteId: str
 
 
+class FeasibilityStatus(BaseModel):
+    """Status of a feasibility job, without its opportunities"""
+
+    id: str
+    status: str | None = None
+
+
 class FeasibilityResponse(BaseModel):
     """FeasibilityResponse model for Umbra"""
 
@@ -76,6 +83,7 @@ class TaskResponseProperties(BaseModel):
     spotlightConstraints: SpotlightConstraints
     windowStartAt: AwareDatetime
     windowEndAt: AwareDatetime
+    status: str | None = None
 
 
 class TaskResponse(BaseModel):
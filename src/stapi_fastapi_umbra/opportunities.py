@@ -12,39 +12,60 @@ from stapi_fastapi.models.shared import Link
 from stapi_fastapi_umbra.models import (FeasibilityRequest,
                                         FeasibilityResponse, ImagingMode,
                                         SpotlightConstraints, TaskRequest,
-                                        TaskResponse)
+                                        TaskResponse, UmbraOpportunity)
+from stapi_fastapi_umbra.opportunity_set import (LinkTemplate, OpportunitySet,
+                                                 OpportunitySetBuilder)
 from stapi_fastapi_umbra.settings import Settings
 
 settings = Settings()
 
 
-def stac_item_to_opportunity(item: dict, product_id: str) -> Opportunity:
-    item_props = item["properties"]
-    start_datetime = datetime.fromisoformat(item_props['end_datetime'])
-    end_datetime = datetime.fromisoformat(item_props['start_datetime'])
-    duration_seconds = (end_datetime - start_datetime).total_seconds()
-    return Opportunity(
-        geometry=item["geometry"],
-        properties=OpportunityProperties(
-            # TODO: Add additional fields here if possible to add extra properties
-            product_id=product_id,
-            datetime=f'{item_props['start_datetime']}/{item_props['end_datetime']}',
-            duration_seconds=duration_seconds,
-            grazing_angle_degrees=[item_props['umbra:grazing_angle_degrees'], item_props['umbra:grazing_angle_degrees']],
-            target_azimuth_angle_degrees=[item_props['umbra:target_azimuth_angle_degrees'], item_props['umbra:target_azimuth_angle_degrees']],
+ORDER_LINK_HREF = f"{settings.fastapi_url}/orders"
+
+ARCHIVE_ORDER_LINK = LinkTemplate(
+    rel="create-order",
+    href=ORDER_LINK_HREF,
+    type="application/json",
+    method="POST",
+    body="archive",
+)
+
+# TODO: body from TaskRequest
+TASK_ORDER_LINK = LinkTemplate(
+    rel="create-order",
+    href=ORDER_LINK_HREF,
+    type="application/json",
+    method="POST",
+    body="task",
+)
+
+
+def stac_items_to_opportunity_set(items: list[dict], product_id: str) -> OpportunitySet:
+    builder = OpportunitySetBuilder(product_id)
+    for item in items:
+        # TODO: Add additional fields here if possible to add extra properties
+        item_props = item["properties"]
+        start_datetime = datetime.fromisoformat(item_props['start_datetime'])
+        end_datetime = datetime.fromisoformat(item_props['end_datetime'])
+        grazing = item_props['umbra:grazing_angle_degrees']
+        azimuth = item_props['umbra:target_azimuth_angle_degrees']
+        builder.append(
+            start=start_datetime,
+            end=end_datetime,
+            duration=(end_datetime - start_datetime).total_seconds(),
+            grazing=(grazing, grazing),
+            azimuth=(azimuth, azimuth),
             satellite_id=item_props['platform'],
-            imaging_mode="SPOTLIGHT_ARCHIVE"
-        ),
-        links=[Link(
-            rel="create-order",
-            href=f"{settings.fastapi_url}/orders",
-            type="application/json",
-            method="POST",
-            body={
-                "archive_id": item["id"],
-            }
-        )]
-    )
+            imaging_mode="SPOTLIGHT_ARCHIVE",
+            geometry=builder.intern_geometry(item["geometry"]),
+            link=ARCHIVE_ORDER_LINK,
+            item_id=item["id"],
+        )
+    return builder.build()
+
+
+def stac_item_to_opportunity(item: dict, product_id: str) -> Opportunity:
+    return stac_items_to_opportunity_set([item], product_id).to_opportunities()[0]
 
 
 def opportunity_request_to_feasibility_request(
@@ -71,35 +92,37 @@ def feasibility_response_to_opportunity_list(
     feasibility_response: FeasibilityResponse, product_id: str
 ) -> list[Opportunity]:
     geometry = feasibility_response.feasibilityRequest.spotlightConstraints.geometry
-    return [
-        Opportunity(
-            properties=OpportunityProperties(
-                product_id=product_id,
-                datetime=f"{o.windowStartAt.isoformat()}/{o.windowEndAt.isoformat()}",
-                duration_seconds=o.durationSec,
-                grazing_angle_degrees=[o.grazingAngleStartDegrees, o.grazingAngleEndDegrees],
-                target_azimuth_angle_degrees=[o.targetAzimuthAngleStartDegrees, o.targetAzimuthAngleEndDegrees],
-                satellite_id=o.satelliteId,
-                imaging_mode="SPOTLIGHT",
-            ),
-            geometry=geometry,
-            links=[
-                Link(
-                    rel="create-order",
-                    href=f"{settings.fastapi_url}/orders",
-                    type="application/json",
-                    method="POST",
-                    # TODO: body from TaskRequest
-                    body={
-                        "geometry": geometry.model_dump(),
-                        "datetime": f"{o.windowStartAt.isoformat()}/{o.windowEndAt.isoformat()}",
-                        "product_id": "umbra_spotlight"
-                    }
-                )
-            ]
+    return umbra_opportunities_to_opportunity_list(
+        feasibility_response.opportunities, geometry=geometry, product_id=product_id
+    )
+
+
+def umbra_opportunities_to_opportunity_set(
+    umbra_opportunities: list[UmbraOpportunity], geometry: Point, product_id: str
+) -> OpportunitySet:
+    builder = OpportunitySetBuilder(product_id)
+    shared_geometry = builder.intern_geometry(geometry.model_dump_json(exclude_none=True))
+    for o in umbra_opportunities:
+        builder.append(
+            start=o.windowStartAt,
+            end=o.windowEndAt,
+            duration=o.durationSec,
+            grazing=(o.grazingAngleStartDegrees, o.grazingAngleEndDegrees),
+            azimuth=(o.targetAzimuthAngleStartDegrees, o.targetAzimuthAngleEndDegrees),
+            satellite_id=o.satelliteId,
+            imaging_mode="SPOTLIGHT",
+            geometry=shared_geometry,
+            link=TASK_ORDER_LINK,
         )
-        for o in feasibility_response.opportunities
-    ]
+    return builder.build()
+
+
+def umbra_opportunities_to_opportunity_list(
+    umbra_opportunities: list[UmbraOpportunity], geometry: Point, product_id: str
+) -> list[Opportunity]:
+    return umbra_opportunities_to_opportunity_set(
+        umbra_opportunities, geometry=geometry, product_id=product_id
+    ).to_opportunities()
 
 
 def opportunity_request_to_task_request(opportunity_request: OpportunityRequest) -> TaskRequest:
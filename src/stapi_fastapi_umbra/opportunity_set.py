@@ -0,0 +1,338 @@
+"""Columnar set of opportunities for the backend's internal pipeline
+
+Archive and feasibility results are kept as a struct of NumPy arrays with
+interned satellite ids and shared geometry and link templates, rather than
+lists of pydantic `Opportunity` models each carrying its own copies. Sets
+can be concatenated, filtered and sorted without materializing models and
+are serialized straight to GeoJSON bytes.
+"""
+
+import json
+import math
+from collections.abc import Iterator, Sequence
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Literal
+
+import numpy as np
+from stapi_fastapi.models.opportunity import Opportunity, OpportunityProperties
+from stapi_fastapi.models.shared import Link
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+
+def to_micros(dt: datetime) -> int:
+    return (dt - EPOCH) // MICROSECOND
+
+
+def from_micros(micros: int) -> datetime:
+    return EPOCH + timedelta(microseconds=micros)
+
+
+def _json_number(value: float) -> str:
+    # NaN and infinity aren't JSON; missing angles (NaN) become null.
+    return repr(value) if math.isfinite(value) else "null"
+
+
+@dataclass(frozen=True)
+class LinkTemplate:
+    """A create-order link shared by many opportunities, minus its body"""
+
+    rel: str
+    href: str
+    type: str
+    method: str
+    body: Literal["archive", "task"]
+
+    def to_json_prefix(self) -> str:
+        return (
+            f'{{"rel":{json.dumps(self.rel)},"href":{json.dumps(self.href)},'
+            f'"type":{json.dumps(self.type)},"method":{json.dumps(self.method)},"body":'
+        )
+
+
+class _Interner:
+    def __init__(self, values: Sequence = ()) -> None:
+        self.values = list(values)
+        self.index = {v: i for i, v in enumerate(self.values)}
+
+    def __call__(self, value) -> int:
+        i = self.index.get(value)
+        if i is None:
+            i = self.index[value] = len(self.values)
+            self.values.append(value)
+        return i
+
+
+@dataclass(frozen=True, eq=False)
+class OpportunitySet:
+    """
+    Opportunities as columns. `start` and `end` are microseconds since the
+    epoch, `grazing` and `azimuth` hold (start, end) angle pairs, and
+    `satellite`, `imaging_mode`, `geometry` and `link` index into the shared
+    lookup tuples. `item_id` is the archive item id, or `None`.
+    """
+
+    product_id: str
+    start: np.ndarray
+    end: np.ndarray
+    duration: np.ndarray
+    grazing: np.ndarray
+    azimuth: np.ndarray
+    satellite: np.ndarray
+    imaging_mode: np.ndarray
+    geometry: np.ndarray
+    link: np.ndarray
+    item_id: np.ndarray
+    satellites: tuple[str, ...] = ()
+    imaging_modes: tuple[str, ...] = ()
+    geometries: tuple[str, ...] = ()
+    link_templates: tuple[LinkTemplate, ...] = ()
+
+    @classmethod
+    def empty(cls, product_id: str) -> "OpportunitySet":
+        return OpportunitySetBuilder(product_id).build()
+
+    def __len__(self) -> int:
+        return len(self.start)
+
+    def take(self, indices: np.ndarray | slice) -> "OpportunitySet":
+        """A new set with the rows selected by an index array, mask or slice"""
+        return OpportunitySet(
+            product_id=self.product_id,
+            start=self.start[indices],
+            end=self.end[indices],
+            duration=self.duration[indices],
+            grazing=self.grazing[indices],
+            azimuth=self.azimuth[indices],
+            satellite=self.satellite[indices],
+            imaging_mode=self.imaging_mode[indices],
+            geometry=self.geometry[indices],
+            link=self.link[indices],
+            item_id=self.item_id[indices],
+            satellites=self.satellites,
+            imaging_modes=self.imaging_modes,
+            geometries=self.geometries,
+            link_templates=self.link_templates,
+        )
+
+    def filter(self, mask: np.ndarray) -> "OpportunitySet":
+        return self.take(np.asarray(mask, dtype=bool))
+
+    def sort(self, by: str = "start", descending: bool = False) -> "OpportunitySet":
+        order = np.argsort(getattr(self, by), kind="stable")
+        return self.take(order[::-1] if descending else order)
+
+    def satellite_ids(self) -> np.ndarray:
+        return np.asarray(self.satellites, dtype=object)[self.satellite]
+
+    @classmethod
+    def concat(cls, sets: Sequence["OpportunitySet"]) -> "OpportunitySet":
+        """Concatenate sets of the same product, merging their lookup tables"""
+        if not sets:
+            raise ValueError("at least one OpportunitySet is required")
+        product_ids = {s.product_id for s in sets}
+        if len(product_ids) > 1:
+            raise ValueError(f"cannot concatenate different products {product_ids}")
+
+        tables = {
+            name: _Interner()
+            for name in ("satellites", "imaging_modes", "geometries", "link_templates")
+        }
+        remapped: dict[str, list[np.ndarray]] = {
+            "satellite": [],
+            "imaging_mode": [],
+            "geometry": [],
+            "link": [],
+        }
+        for s in sets:
+            for column, table in zip(remapped, tables):
+                mapping = np.array(
+                    [tables[table](v) for v in getattr(s, table)], dtype=np.int32
+                )
+                remapped[column].append(
+                    mapping[getattr(s, column)] if len(mapping) else getattr(s, column)
+                )
+
+        return cls(
+            product_id=sets[0].product_id,
+            start=np.concatenate([s.start for s in sets]),
+            end=np.concatenate([s.end for s in sets]),
+            duration=np.concatenate([s.duration for s in sets]),
+            grazing=np.concatenate([s.grazing for s in sets]),
+            azimuth=np.concatenate([s.azimuth for s in sets]),
+            item_id=np.concatenate([s.item_id for s in sets]),
+            **{column: np.concatenate(arrays) for column, arrays in remapped.items()},
+            **{name: tuple(table.values) for name, table in tables.items()},
+        )
+
+    def _datetimes(self) -> list[str]:
+        return [
+            f"{from_micros(s).isoformat()}/{from_micros(e).isoformat()}"
+            for s, e in zip(self.start.tolist(), self.end.tolist())
+        ]
+
+    def iter_geojson_features(self) -> Iterator[str]:
+        """Each opportunity as a GeoJSON Feature JSON string"""
+        product_id = json.dumps(self.product_id)
+        satellites = [json.dumps(s) for s in self.satellites]
+        imaging_modes = [json.dumps(m) for m in self.imaging_modes]
+        link_prefixes = [t.to_json_prefix() for t in self.link_templates]
+
+        rows = zip(
+            self._datetimes(),
+            self.duration.tolist(),
+            self.grazing.tolist(),
+            self.azimuth.tolist(),
+            self.satellite.tolist(),
+            self.imaging_mode.tolist(),
+            self.geometry.tolist(),
+            self.link.tolist(),
+            self.item_id.tolist(),
+        )
+        for dt, duration, grazing, azimuth, sat, mode, geom, link, item_id in rows:
+            geometry = self.geometries[geom]
+            if self.link_templates[link].body == "archive":
+                body = f'{{"archive_id":{json.dumps(item_id)}}}'
+            else:
+                body = f'{{"geometry":{geometry},"datetime":"{dt}","product_id":{product_id}}}'
+            yield (
+                f'{{"type":"Feature","geometry":{geometry},"properties":{{'
+                f'"product_id":{product_id},"datetime":"{dt}",'
+                f'"duration_seconds":{_json_number(duration)},'
+                f'"grazing_angle_degrees":[{_json_number(grazing[0])},{_json_number(grazing[1])}],'
+                f'"target_azimuth_angle_degrees":'
+                f'[{_json_number(azimuth[0])},{_json_number(azimuth[1])}],'
+                f'"satellite_id":{satellites[sat]},"imaging_mode":{imaging_modes[mode]}}},'
+                f'"links":[{link_prefixes[link]}{body}}}]}}'
+            )
+
+    def to_geojson_bytes(self, links: list[dict] | None = None) -> bytes:
+        features = ",".join(self.iter_geojson_features())
+        collection_links = f',"links":{json.dumps(links)}' if links else ""
+        return (
+            f'{{"type":"FeatureCollection","features":[{features}]{collection_links}}}'
+        ).encode()
+
+    def to_opportunities(self) -> list[Opportunity]:
+        """Materialize the set as `Opportunity` models"""
+        geometries = [json.loads(g) for g in self.geometries]
+        rows = zip(
+            self._datetimes(),
+            self.duration.tolist(),
+            self.grazing.tolist(),
+            self.azimuth.tolist(),
+            self.satellite.tolist(),
+            self.imaging_mode.tolist(),
+            self.geometry.tolist(),
+            self.link.tolist(),
+            self.item_id.tolist(),
+        )
+        opportunities = []
+        for dt, duration, grazing, azimuth, sat, mode, geom, link, item_id in rows:
+            template = self.link_templates[link]
+            if template.body == "archive":
+                body = {"archive_id": item_id}
+            else:
+                body = {
+                    "geometry": geometries[geom],
+                    "datetime": dt,
+                    "product_id": self.product_id,
+                }
+            opportunities.append(
+                Opportunity(
+                    geometry=geometries[geom],
+                    properties=OpportunityProperties(
+                        product_id=self.product_id,
+                        datetime=dt,
+                        duration_seconds=duration,
+                        grazing_angle_degrees=grazing,
+                        target_azimuth_angle_degrees=azimuth,
+                        satellite_id=self.satellites[sat],
+                        imaging_mode=self.imaging_modes[mode],
+                    ),
+                    links=[
+                        Link(
+                            rel=template.rel,
+                            href=template.href,
+                            type=template.type,
+                            method=template.method,
+                            body=body,
+                        )
+                    ],
+                )
+            )
+        return opportunities
+
+
+class OpportunitySetBuilder:
+    """Accumulates rows for an `OpportunitySet`, interning the shared values"""
+
+    def __init__(self, product_id: str) -> None:
+        self.product_id = product_id
+        self._start: list[int] = []
+        self._end: list[int] = []
+        self._duration: list[float] = []
+        self._grazing: list[tuple[float, float]] = []
+        self._azimuth: list[tuple[float, float]] = []
+        self._satellite: list[int] = []
+        self._imaging_mode: list[int] = []
+        self._geometry: list[int] = []
+        self._link: list[int] = []
+        self._item_id: list[str | None] = []
+        self._satellites = _Interner()
+        self._imaging_modes = _Interner()
+        self._geometries = _Interner()
+        self._link_templates = _Interner()
+
+    def intern_geometry(self, geometry: dict | str) -> int:
+        if not isinstance(geometry, str):
+            geometry = json.dumps(geometry, separators=(",", ":"))
+        return self._geometries(geometry)
+
+    def append(
+        self,
+        start: datetime,
+        end: datetime,
+        duration: float,
+        grazing: tuple[float, float],
+        azimuth: tuple[float, float],
+        satellite_id: str,
+        imaging_mode: str,
+        geometry: int,
+        link: LinkTemplate,
+        item_id: str | None = None,
+    ) -> None:
+        """Add a row. `geometry` is an index returned by `intern_geometry`."""
+        self._start.append(to_micros(start))
+        self._end.append(to_micros(end))
+        self._duration.append(duration)
+        self._grazing.append(grazing)
+        self._azimuth.append(azimuth)
+        self._satellite.append(self._satellites(satellite_id))
+        self._imaging_mode.append(self._imaging_modes(imaging_mode))
+        self._geometry.append(geometry)
+        self._link.append(self._link_templates(link))
+        self._item_id.append(item_id)
+
+    def build(self) -> OpportunitySet:
+        item_id = np.empty(len(self._item_id), dtype=object)
+        item_id[:] = self._item_id
+        return OpportunitySet(
+            product_id=self.product_id,
+            start=np.array(self._start, dtype=np.int64),
+            end=np.array(self._end, dtype=np.int64),
+            duration=np.array(self._duration, dtype=np.float64),
+            grazing=np.array(self._grazing, dtype=np.float64).reshape(-1, 2),
+            azimuth=np.array(self._azimuth, dtype=np.float64).reshape(-1, 2),
+            satellite=np.array(self._satellite, dtype=np.int32),
+            imaging_mode=np.array(self._imaging_mode, dtype=np.int32),
+            geometry=np.array(self._geometry, dtype=np.int32),
+            link=np.array(self._link, dtype=np.int32),
+            item_id=item_id,
+            satellites=tuple(self._satellites.values),
+            imaging_modes=tuple(self._imaging_modes.values),
+            geometries=tuple(self._geometries.values),
+            link_templates=tuple(self._link_templates.values),
+        )
@@ -0,0 +1,211 @@
+"""Local orbital pre-screening of feasibility windows
+
+Propagates the Umbra constellation from a local TLE file with the vectorized
+SGP4 implementation and computes coarse access intervals for a target point.
+Feasibility windows with no possible access can be skipped entirely, and the
+others narrowed to the candidate intervals before a Canopy job is created.
+"""
+
+import logging
+import math
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from stapi_fastapi_umbra.models import SpotlightConstraints
+from stapi_fastapi_umbra.parameters import DEFAULT_SATELLITE_IDS
+from stapi_fastapi_umbra.settings import Settings
+
+try:
+    import numpy as np
+    from sgp4.api import Satrec, SatrecArray
+except ImportError:  # pragma: no cover
+    np = None
+
+logger = logging.getLogger(__name__)
+
+WGS84_A_KM = 6378.137
+WGS84_E2 = 6.69437999014e-3
+UNIX_EPOCH_JD = 2440587.5
+J2000_JD = 2451545.0
+
+Interval = tuple[datetime, datetime]
+
+
+def load_tles(path: str | Path, satellite_ids: list[str]) -> dict[str, tuple[str, str]]:
+    """
+    Read a three-line TLE file, returning line pairs for the requested
+    satellites. Names are matched case-insensitively.
+
+    Raises `ValueError` if any requested satellite is missing: screening with
+    part of the constellation would skip windows where only the missing
+    satellites have access.
+    """
+    wanted = {s.upper(): s for s in satellite_ids}
+    lines = [line.rstrip() for line in Path(path).read_text().splitlines() if line.strip()]
+    tles = {}
+    for name, line1, line2 in zip(lines[0::3], lines[1::3], lines[2::3]):
+        name = name.removeprefix("0 ").strip().upper()
+        if name in wanted:
+            tles[wanted[name]] = (line1, line2)
+    missing = set(satellite_ids) - set(tles)
+    if missing:
+        raise ValueError(f"no TLEs found for {sorted(missing)} in {path}")
+    return tles
+
+
+def _target_ecef(lon_deg: float, lat_deg: float) -> tuple["np.ndarray", "np.ndarray"]:
+    """Target position (km) on the WGS84 ellipsoid and its local up vector"""
+    lon, lat = math.radians(lon_deg), math.radians(lat_deg)
+    n = WGS84_A_KM / math.sqrt(1 - WGS84_E2 * math.sin(lat) ** 2)
+    position = np.array(
+        [
+            n * math.cos(lat) * math.cos(lon),
+            n * math.cos(lat) * math.sin(lon),
+            n * (1 - WGS84_E2) * math.sin(lat),
+        ]
+    )
+    up = np.array(
+        [math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat)]
+    )
+    return position, up
+
+
+def _gmst(jd: "np.ndarray") -> "np.ndarray":
+    """Greenwich mean sidereal time in radians (IAU 1982, UTC as UT1)"""
+    d = jd - J2000_JD
+    t = d / 36525.0
+    degrees = 280.46061837 + 360.98564736629 * d + 0.000387933 * t**2 - t**3 / 38710000.0
+    return np.radians(degrees % 360.0)
+
+
+def _runs(mask: "np.ndarray") -> list[tuple[int, int]]:
+    """Inclusive index ranges of consecutive True values"""
+    edges = np.diff(mask.astype(np.int8), prepend=0, append=0)
+    starts = np.flatnonzero(edges == 1)
+    stops = np.flatnonzero(edges == -1) - 1
+    return list(zip(starts.tolist(), stops.tolist()))
+
+
+def _merge(intervals: list[Interval], gap: timedelta) -> list[Interval]:
+    merged: list[Interval] = []
+    for start, end in sorted(intervals):
+        if merged and start - merged[-1][1] <= gap:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+class Prescreener:
+    """Coarse access computation for the Umbra constellation"""
+
+    def __init__(
+        self,
+        tles: dict[str, tuple[str, str]],
+        step_seconds: int = 30,
+        padding_seconds: int = 300,
+        merge_gap_seconds: int = 12 * 3600,
+        grazing_angle_margin_degrees: float = 2.0,
+        max_tle_age_days: float = 3.0,
+    ) -> None:
+        if np is None:
+            raise ImportError("install numpy and sgp4 to use feasibility pre-screening")
+        if not tles:
+            raise ValueError("pre-screening needs at least one TLE")
+        self.satellite_ids = list(tles)
+        satellites = [Satrec.twoline2rv(line1, line2) for line1, line2 in tles.values()]
+        self.satellites = SatrecArray(satellites)
+        self.epochs = np.array(
+            [(s.jdsatepoch - UNIX_EPOCH_JD + s.jdsatepochF) * 86400.0 for s in satellites]
+        )
+        self.step_seconds = step_seconds
+        self.padding = timedelta(seconds=padding_seconds)
+        self.merge_gap = timedelta(seconds=merge_gap_seconds)
+        self.grazing_angle_margin_degrees = grazing_angle_margin_degrees
+        self.max_tle_age_seconds = max_tle_age_days * 86400.0
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "Prescreener | None":
+        if not settings.prescreen_tle_path:
+            return None
+        return cls(
+            load_tles(settings.prescreen_tle_path, DEFAULT_SATELLITE_IDS),
+            step_seconds=settings.prescreen_step_seconds,
+            padding_seconds=settings.prescreen_padding_seconds,
+            merge_gap_seconds=settings.prescreen_merge_gap_seconds,
+            max_tle_age_days=settings.prescreen_max_tle_age_days,
+        )
+
+    def stale_satellites(self, start: datetime, end: datetime) -> list[str]:
+        """
+        Satellites whose TLE epoch is further than the maximum TLE age from
+        some part of [start, end). SGP4 errors grow by kilometres a day away
+        from the epoch, enough to miss a pass with the padding used here.
+        """
+        age = np.maximum(end.timestamp() - self.epochs, self.epochs - start.timestamp())
+        return [s for s, a in zip(self.satellite_ids, age.tolist()) if a > self.max_tle_age_seconds]
+
+    def grazing_angles(
+        self, lon: float, lat: float, start: datetime, end: datetime
+    ) -> tuple["np.ndarray", "np.ndarray"]:
+        """
+        Sample times (unix seconds) and the grazing angle in degrees of every
+        satellite at each sample, shape (satellites, samples). Samples where
+        propagation failed are NaN.
+        """
+        t = np.arange(start.timestamp(), end.timestamp() + self.step_seconds, self.step_seconds)
+        days = np.floor(t / 86400.0)
+        jd = UNIX_EPOCH_JD + days
+        fr = (t - days * 86400.0) / 86400.0
+        error, teme, _ = self.satellites.sgp4(jd, fr)
+
+        # TEME -> ECEF, ignoring polar motion and the equation of the equinoxes
+        theta = _gmst(jd + fr)
+        cos, sin = np.cos(theta), np.sin(theta)
+        ecef = np.stack(
+            [
+                cos * teme[..., 0] + sin * teme[..., 1],
+                -sin * teme[..., 0] + cos * teme[..., 1],
+                teme[..., 2],
+            ],
+            axis=-1,
+        )
+
+        target, up = _target_ecef(lon, lat)
+        line_of_sight = ecef - target
+        distance = np.linalg.norm(line_of_sight, axis=-1)
+        elevation = np.degrees(np.arcsin(line_of_sight @ up / distance))
+        elevation[error != 0] = np.nan
+        return t, elevation
+
+    def candidate_intervals(
+        self, constraints: SpotlightConstraints, start: datetime, end: datetime
+    ) -> list[Interval] | None:
+        """
+        Sub-intervals of [start, end) where any satellite may see the target
+        within the grazing angle bounds. Returns `None` if the window could
+        not be screened, in which case it should be requested as-is.
+        """
+        stale = self.stale_satellites(start, end)
+        if stale:
+            logger.warning(f"TLEs for {stale} are too old for {start}/{end}, skipping pre-screen")
+            return None
+
+        lon, lat = constraints.geometry.coordinates[:2]
+        t, grazing = self.grazing_angles(lon, lat, start, end)
+        if np.isnan(grazing).any():
+            logger.warning("SGP4 propagation failed, skipping pre-screen")
+            return None
+
+        low = constraints.grazingAngleMinDegrees - self.grazing_angle_margin_degrees
+        high = constraints.grazingAngleMaxDegrees + self.grazing_angle_margin_degrees
+        visible = ((grazing >= low) & (grazing <= high)).any(axis=0)
+
+        intervals = [
+            (
+                max(datetime.fromtimestamp(t[i], tz=timezone.utc) - self.padding, start),
+                min(datetime.fromtimestamp(t[j], tz=timezone.utc) + self.padding, end),
+            )
+            for i, j in _runs(visible)
+        ]
+        return _merge(intervals, self.merge_gap)
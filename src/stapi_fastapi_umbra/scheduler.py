@@ -0,0 +1,90 @@
+"""Fair queuing of upstream Canopy calls across callers"""
+
+import asyncio
+import heapq
+import itertools
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
+from stapi_fastapi_umbra.metrics import Metrics, metrics
+
+
+class FairScheduler:
+    """
+    Start-time fair queuing over a fixed number of upstream slots.
+
+    Every call is tagged with a virtual finish time of
+    `max(virtual_time, tenant's last finish) + cost / weight` and queued
+    calls are dispatched in finish-time order. A tenant flooding the queue
+    only pushes its own finish times further out, so other tenants' calls
+    keep being dispatched at their fair share. Tenants missing from
+    `weights` have a weight of 1; a weight of 2 gets twice the share.
+    """
+
+    def __init__(
+        self,
+        concurrency: int,
+        weights: dict[str, float] | None = None,
+        metrics: Metrics = metrics,
+    ) -> None:
+        self.concurrency = concurrency
+        self.weights = weights or {}
+        self.metrics = metrics
+        self._available = concurrency
+        self._virtual_time = 0.0
+        self._finish: dict[str, float] = {}
+        self._queue: list[tuple[float, int, float, str, asyncio.Future]] = []
+        self._sequence = itertools.count()
+
+    def _tag(self, tenant: str, cost: float) -> tuple[float, float]:
+        start = max(self._virtual_time, self._finish.get(tenant, 0.0))
+        finish = start + cost / self.weights.get(tenant, 1.0)
+        self._finish[tenant] = finish
+        return start, finish
+
+    async def _acquire(self, tenant: str, cost: float) -> None:
+        start, finish = self._tag(tenant, cost)
+        if self._available > 0 and not self._queue:
+            self._available -= 1
+            self._virtual_time = start
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (finish, next(self._sequence), start, tenant, future))
+        self.metrics.queue_changed(tenant, 1)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just as we were cancelled.
+                self._release()
+            raise
+
+    def _release(self) -> None:
+        while self._queue:
+            _, _, start, tenant, future = heapq.heappop(self._queue)
+            self.metrics.queue_changed(tenant, -1)
+            if future.done():
+                continue
+            self._virtual_time = start
+            future.set_result(None)
+            return
+        self._available += 1
+        self._prune()
+
+    def _prune(self) -> None:
+        # Tenants whose finish time has passed have no backlog to remember.
+        if len(self._finish) > 1024:
+            self._finish = {t: f for t, f in self._finish.items() if f > self._virtual_time}
+
+    @asynccontextmanager
+    async def slot(self, tenant: str, cost: float = 1.0) -> AsyncIterator[None]:
+        await self._acquire(tenant, cost)
+        try:
+            yield
+        finally:
+            self._release()
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queue)
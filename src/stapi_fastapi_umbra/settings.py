@@ -32,7 +32,40 @@ class Settings(BaseSettings):
     canopy_token: str | None = None
     canopy_api_url: str = CANOPY_API_SANDBOX_URL
     canopy_url: str = CANOPY_URL
+    canopy_max_concurrency: int = 32
+    canopy_connections_per_credential: int = 8
+    canopy_max_credentials: int = 256
+    # Fair-share weights keyed by tenant id, as reported by /metrics
+    canopy_tenant_weights: dict[str, float] = {}
     feasibility_timeout: int = 10
+    opportunities_timeout: float = 60
+    orders_timeout: float = 30
+    opportunity_stats_timeout: float = 120
+    request_timeout_max: float = 300
+    order_batch_max_size: int = 500
+    order_batch_concurrency: int = 8
+    order_batch_timeout: float = 120
+    order_events_min_interval: float = 2.0
+    order_events_max_interval: float = 60.0
+    order_events_backoff: float = 1.5
+    order_events_keepalive: float = 15.0
+    order_events_max_ids: int = 100
+    feasibility_cache_bucket_seconds: int = 3600
+    feasibility_cache_min_ttl: int = 300
+    feasibility_cache_max_ttl: int = 6 * 3600
+    feasibility_cache_coordinate_precision: int = 3
+    archive_cache_ttl: int = 3600
+    archive_stats_max_pages: int = 10_000
+    archive_stats_page_size: int = 500
+    cursor_ttl: int = 900
+    cursor_max_entries: int = 256
+    disk_cache_mmap_size: int = 256 * 1024 * 1024
+    disk_cache_compaction_interval: int = 600
+    prescreen_tle_path: str | None = None
+    prescreen_step_seconds: int = 30
+    prescreen_padding_seconds: int = 300
+    prescreen_merge_gap_seconds: int = 12 * 3600
+    prescreen_max_tle_age_days: float = 3.0
 
     @property
     def fastapi_url(self):
@@ -0,0 +1,472 @@
+"""Soak test for memory retained by the STAPI routes
+
+Drives each `StapiRouter` route in-process for many iterations against a
+local Canopy stub, with tracemalloc tracing each route separately after a
+warm-up. Memory still held once a route's iterations are done is attributed
+to the allocation sites holding it, and the run fails if any route retains
+more than the threshold, so leaks are caught before deploy rather than by
+nightly restarts.
+
+    umbra-soak --iterations 2000 --threshold-kib 256 --routes products product
+"""
+
+import argparse
+import asyncio
+import gc
+import itertools
+import json
+import linecache
+import logging
+import math
+import sys
+import time
+import tracemalloc
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from uuid import uuid4
+
+import httpx
+from fastapi import FastAPI
+
+from stapi_fastapi_umbra import client
+from stapi_fastapi_umbra.backend import UmbraBackend
+from stapi_fastapi_umbra.cursors import CursorStore
+from stapi_fastapi_umbra.metrics import metrics
+from stapi_fastapi_umbra.stapi_fastapi.api import StapiRouter
+
+TOKEN = "soak-test-token"
+POINT = {"type": "Point", "coordinates": [-112.146, 40.522]}
+
+# tracemalloc's own bookkeeping and import machinery aren't leaks.
+SNAPSHOT_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, linecache.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+]
+
+
+def _iso(dt: datetime) -> str:
+    return dt.isoformat().replace("+00:00", "Z")
+
+
+class CanopyStub:
+    """
+    In-process stand-in for the Canopy archive, feasibility and tasking
+    APIs, mounted with an `httpx.MockTransport`. It keeps no per-request
+    state beyond feasibility jobs not yet collected, so it doesn't grow
+    itself.
+
+    With `latency`, each response is delayed by that many seconds, and
+    requests whose read timeout is shorter fail with `httpx.ReadTimeout` as
+    they would against a slow Canopy.
+
+    Feasibility opportunities fall on a fixed grid of
+    `feasibility_opportunities` per day, as a constellation's passes would,
+    so overlapping windows agree on the opportunities they share.
+    """
+
+    def __init__(
+        self,
+        archive_items: int = 20,
+        feasibility_opportunities: int = 20,
+        archive_page_size: int | None = None,
+        latency: float = 0,
+    ) -> None:
+        self.archive_items = archive_items
+        self.feasibility_opportunities = feasibility_opportunities
+        # Without a page size the whole archive is a single page.
+        self.archive_page_size = archive_page_size or archive_items
+        self.latency = latency
+        self.requests = 0
+        self.archive_requests = 0
+        self.feasibility_requests = 0
+        self._feasibilities: dict[str, dict] = {}
+
+    def transport(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self.handle)
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        if self.latency:
+            read_timeout = request.extensions.get("timeout", {}).get("read")
+            if read_timeout is not None and read_timeout < self.latency:
+                raise httpx.ReadTimeout("Canopy stub is slower than the timeout", request=request)
+            await asyncio.sleep(self.latency)
+        return self(request)
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        path = request.url.path
+        if request.method == "POST" and path.endswith("/archive/search"):
+            self.archive_requests += 1
+            return httpx.Response(200, json=self._archive_page(json.loads(request.content)))
+        if request.method == "POST" and path.endswith("/tasking/feasibilities"):
+            self.feasibility_requests += 1
+            feasibility_id = str(uuid4())
+            self._feasibilities[feasibility_id] = json.loads(request.content)
+            return httpx.Response(201, json={"id": feasibility_id, "status": "RECEIVED"})
+        if request.method == "GET" and "/tasking/feasibilities/" in path:
+            feasibility_request = self._feasibilities.pop(path.rsplit("/", 1)[-1], None)
+            if feasibility_request is None:
+                return httpx.Response(404)
+            return httpx.Response(200, json=self._feasibility(feasibility_request))
+        if request.method == "POST" and path.endswith("/tasking/tasks"):
+            task_request = json.loads(request.content)
+            return httpx.Response(201, json=self._task(str(uuid4()), task_request, "RECEIVED"))
+        if request.method == "GET" and "/tasking/tasks/" in path:
+            now = datetime.now(tz=timezone.utc)
+            task_request = {
+                "spotlightConstraints": {"geometry": POINT},
+                "windowStartAt": _iso(now),
+                "windowEndAt": _iso(now + timedelta(hours=1)),
+            }
+            return httpx.Response(
+                200, json=self._task(path.rsplit("/", 1)[-1], task_request, "DELIVERED")
+            )
+        return httpx.Response(404)
+
+    def _archive_page(self, search: dict) -> dict:
+        start = datetime.now(tz=timezone.utc) - timedelta(days=30)
+        offset = search.get("offset", 0)
+        end = min(offset + self.archive_page_size, self.archive_items)
+        features = []
+        for i in range(offset, end):
+            scene_start = start + timedelta(days=i)
+            lon, lat = POINT["coordinates"]
+            features.append(
+                {
+                    "type": "Feature",
+                    "id": f"archive-{i}",
+                    "geometry": {
+                        "type": "Polygon",
+                        "coordinates": [
+                            [
+                                [lon - 0.02, lat - 0.02],
+                                [lon + 0.02, lat - 0.02],
+                                [lon + 0.02, lat + 0.02],
+                                [lon - 0.02, lat + 0.02],
+                                [lon - 0.02, lat - 0.02],
+                            ]
+                        ],
+                    },
+                    "properties": {
+                        "start_datetime": _iso(scene_start),
+                        "end_datetime": _iso(scene_start + timedelta(seconds=12)),
+                        "platform": f"UMBRA_{4 + i % 5:02d}",
+                        "umbra:grazing_angle_degrees": 30.0 + i,
+                        "umbra:target_azimuth_angle_degrees": (17.0 * i) % 360,
+                    },
+                    "links": [],
+                }
+            )
+        links = []
+        if end < self.archive_items:
+            links.append(
+                {
+                    "rel": "next",
+                    "href": "https://api.canopy.umbra.space/archive/search",
+                    "method": "POST",
+                    "body": {"offset": end},
+                    "merge": True,
+                }
+            )
+        return {"type": "FeatureCollection", "features": features, "links": links}
+
+    def _feasibility(self, feasibility_request: dict) -> dict:
+        start = datetime.fromisoformat(feasibility_request["windowStartAt"])
+        end = datetime.fromisoformat(feasibility_request["windowEndAt"])
+        step = 24 * 3600 / self.feasibility_opportunities
+        opportunities = []
+        for i in range(math.ceil(start.timestamp() / step), math.ceil(end.timestamp() / step)):
+            window_start = datetime.fromtimestamp(i * step, tz=timezone.utc)
+            opportunities.append(
+                {
+                    "windowStartAt": _iso(window_start),
+                    "windowEndAt": _iso(window_start + timedelta(seconds=12)),
+                    "durationSec": 12.0,
+                    "grazingAngleStartDegrees": 40.0,
+                    "grazingAngleEndDegrees": 45.0,
+                    "targetAzimuthAngleStartDegrees": 10.0,
+                    "targetAzimuthAngleEndDegrees": 20.0,
+                    "satelliteId": f"UMBRA_{4 + i % 5:02d}",
+                }
+            )
+        now = _iso(datetime.now(tz=timezone.utc))
+        return {
+            "id": str(uuid4()),
+            "status": "COMPLETED",
+            "createdAt": now,
+            "updatedAt": now,
+            "opportunities": opportunities,
+            "feasibilityRequest": feasibility_request,
+        }
+
+    def _task(self, task_id: str, task_request: dict, status: str) -> dict:
+        return {
+            "id": task_id,
+            "type": "Feature",
+            "geometry": task_request["spotlightConstraints"]["geometry"],
+            "properties": {
+                "spotlightConstraints": task_request["spotlightConstraints"],
+                "windowStartAt": task_request["windowStartAt"],
+                "windowEndAt": task_request["windowEndAt"],
+                "status": status,
+            },
+        }
+
+
+Scenario = Callable[[httpx.AsyncClient], Awaitable[None]]
+
+
+async def _request(http: httpx.AsyncClient, method: str, url: str, **kwargs) -> httpx.Response:
+    response = await http.request(method, url, **kwargs)
+    if response.status_code >= 400:
+        raise RuntimeError(f"{method} {url} returned {response.status_code}: {response.text}")
+    return response
+
+
+async def _paged_search(http: httpx.AsyncClient, search: dict) -> None:
+    response = await _request(http, "POST", "/opportunities?limit=10", json=search)
+    while next_link := next(
+        (link for link in response.json().get("links", []) if link["rel"] == "next"), None
+    ):
+        response = await _request(http, "POST", next_link["href"], json=next_link["body"])
+
+
+async def _order_events(http: httpx.AsyncClient, url: str) -> None:
+    async with http.stream("GET", url) as response:
+        if response.status_code >= 400:
+            raise RuntimeError(f"GET {url} returned {response.status_code}")
+        async for _ in response.aiter_bytes():
+            pass
+
+
+def _rotating_tokens(search: dict) -> Scenario:
+    """Searches with a credential never seen before on every call"""
+    tokens = itertools.count()
+
+    def rotated(http: httpx.AsyncClient) -> Awaitable[httpx.Response]:
+        headers = {"Authorization": f"Bearer {TOKEN}-{next(tokens)}"}
+        return _request(http, "POST", "/opportunities", json=search, headers=headers)
+
+    return rotated
+
+
+def scenarios() -> dict[str, Scenario]:
+    """One request sequence per route, keyed by route name"""
+    now = datetime.now(tz=timezone.utc)
+
+    def window(start: timedelta, end: timedelta) -> str:
+        return f"{(now + start).isoformat()}/{(now + end).isoformat()}"
+
+    # Fixed windows, so repeated searches hit the same cache entries.
+    search = {
+        "geometry": POINT,
+        "datetime": window(timedelta(days=-30), timedelta(days=2)),
+        "product_id": "umbra_spotlight",
+    }
+    archive_search = {**search, "datetime": window(timedelta(days=-30), timedelta(days=-1))}
+    order = {**search, "datetime": window(timedelta(days=1), timedelta(days=1, minutes=15))}
+
+    order_id = str(uuid4())
+    return {
+        "root": lambda http: _request(http, "GET", "/"),
+        "products": lambda http: _request(http, "GET", "/products"),
+        "product": lambda http: _request(http, "GET", "/products/umbra_spotlight"),
+        "search-opportunities": lambda http: _request(
+            http, "POST", "/opportunities", json=search
+        ),
+        "search-opportunities-archive": lambda http: _request(
+            http, "POST", "/opportunities", json=archive_search
+        ),
+        "search-opportunities-paged": lambda http: _paged_search(http, search),
+        # Per-credential pools, metrics and scheduler state must stay bounded however
+        # many callers come and go.
+        "search-rotating-tokens": _rotating_tokens(archive_search),
+        "opportunity-stats": lambda http: _request(
+            http, "POST", "/opportunities/stats", json=archive_search
+        ),
+        "create-order": lambda http: _request(http, "POST", "/orders", json=order),
+        "create-orders": lambda http: _request(http, "POST", "/orders/batch", json=[order] * 3),
+        "get-order": lambda http: _request(http, "GET", f"/orders/{order_id}"),
+        "get-order-events": lambda http: _order_events(http, f"/orders/{order_id}/events"),
+        "order-events": lambda http: _order_events(
+            http, f"/orders/events?ids={order_id},{uuid4()}"
+        ),
+    }
+
+
+@dataclass
+class RouteReport:
+    route: str
+    iterations: int
+    seconds: float = 0.0
+    # Bytes allocated after the baseline snapshot and still alive at the end
+    retained: int = 0
+    # Iteration the baseline snapshot was taken at
+    baseline_iteration: int = 0
+    # (iteration, traced bytes) at each snapshot
+    samples: list[tuple[int, int]] = field(default_factory=list)
+    sites: list[tracemalloc.StatisticDiff] = field(default_factory=list)
+
+    @property
+    def per_iteration(self) -> float:
+        return self.retained / max(self.iterations - self.baseline_iteration, 1)
+
+
+def _snapshot() -> tracemalloc.Snapshot:
+    gc.collect()
+    return tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+
+
+def _traced(snapshot: tracemalloc.Snapshot) -> int:
+    return sum(stat.size for stat in snapshot.statistics("filename"))
+
+
+async def soak_route(
+    http: httpx.AsyncClient,
+    route: str,
+    scenario: Scenario,
+    iterations: int,
+    warmup: int,
+    interval: int,
+    frames: int,
+    top: int,
+) -> RouteReport:
+    """
+    Run `scenario` `warmup` times untraced, then `iterations` times traced
+    with a snapshot every `interval` iterations, and report what was
+    allocated after the first snapshot and is still alive at the end.
+
+    Measuring from the first snapshot rather than the start of tracing
+    leaves out bounded caches and pools that are still filling up during
+    the first interval.
+    """
+    for _ in range(warmup):
+        await scenario(http)
+    # Let pollers and other tasks started by the warm-up finish.
+    await asyncio.sleep(0)
+
+    report = RouteReport(route, iterations)
+    tracemalloc.start(frames)
+    try:
+        baseline = snapshot = _snapshot()
+        report.samples.append((0, _traced(baseline)))
+        started = time.perf_counter()
+        for i in range(1, iterations + 1):
+            await scenario(http)
+            if i % interval == 0 or i == iterations:
+                await asyncio.sleep(0)
+                snapshot = _snapshot()
+                report.samples.append((i, _traced(snapshot)))
+                if report.baseline_iteration == 0 and i < iterations:
+                    baseline, report.baseline_iteration = snapshot, i
+        report.seconds = time.perf_counter() - started
+    finally:
+        tracemalloc.stop()
+
+    report.retained = sum(s.size_diff for s in snapshot.compare_to(baseline, "filename"))
+    growth = [s for s in snapshot.compare_to(baseline, "traceback") if s.size_diff > 0]
+    report.sites = growth[:top]
+    return report
+
+
+def print_report(report: RouteReport, threshold: int, file=sys.stdout) -> None:
+    verdict = "FAIL" if report.retained > threshold else "ok"
+    print(
+        f"{verdict:4} {report.route:30} retained {report.retained / 1024:9.1f} KiB "
+        f"({report.per_iteration:8.1f} B/iteration) "
+        f"{report.iterations / report.seconds:8.1f} it/s",
+        file=file,
+    )
+    if report.retained <= threshold:
+        return
+    trend = ", ".join(f"{i}: {size / 1024:.0f}" for i, size in report.samples)
+    print(f"       traced KiB by iteration: {trend}", file=file)
+    for stat in report.sites:
+        print(
+            f"       +{stat.size_diff / 1024:.1f} KiB in {stat.count_diff:+} blocks, allocated at:",
+            file=file,
+        )
+        for line in stat.traceback.format(most_recent_first=True):
+            print(f"         {line}", file=file)
+
+
+def build_app(stub: CanopyStub) -> FastAPI:
+    """The dev app's router, with Canopy replaced by `stub`"""
+    client.pools.transport = stub.transport()
+    client.pools._pools.clear()
+    # Small per-credential bounds and cursor store fill up during the warm-up
+    # instead of looking like growth while traced.
+    client.pools.max_credentials = 8
+    metrics.max_tenants = 8
+    app = FastAPI()
+    app.include_router(
+        StapiRouter(backend=UmbraBackend(), cursors=CursorStore(max_entries=8)).router
+    )
+    return app
+
+
+async def soak(args: argparse.Namespace) -> list[RouteReport]:
+    stub = CanopyStub()
+    app = build_app(stub)
+    routes = scenarios()
+    selected = args.routes or list(routes)
+    unknown = set(selected) - set(routes)
+    if unknown:
+        raise SystemExit(f"unknown routes {sorted(unknown)}, choose from {list(routes)}")
+
+    reports = []
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app),
+        base_url="http://soak",
+        headers={"Authorization": f"Bearer {TOKEN}"},
+    ) as http:
+        for route in selected:
+            report = await soak_route(
+                http,
+                route,
+                routes[route],
+                iterations=args.iterations,
+                warmup=args.warmup,
+                interval=args.interval,
+                frames=args.frames,
+                top=args.top,
+            )
+            print_report(report, args.threshold_kib * 1024)
+            reports.append(report)
+    print(f"{stub.requests} Canopy stub requests")
+    return reports
+
+
+def cli():
+    parser = argparse.ArgumentParser(
+        description="Soak the STAPI routes and fail on retained memory growth"
+    )
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument(
+        "--interval", type=int, default=100, help="iterations between memory samples"
+    )
+    parser.add_argument(
+        "--threshold-kib",
+        type=float,
+        default=256,
+        help="retained memory per route above which the run fails",
+    )
+    parser.add_argument("--frames", type=int, default=8, help="traceback depth per allocation")
+    parser.add_argument("--top", type=int, default=5, help="allocation sites shown per failure")
+    parser.add_argument("--routes", nargs="*", help="routes to soak (default: all)")
+    args = parser.parse_args()
+
+    # Per-request logging would dominate both the output and the allocations.
+    logging.disable(logging.INFO)
+    reports = asyncio.run(soak(args))
+    if any(r.retained > args.threshold_kib * 1024 for r in reports):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    cli()
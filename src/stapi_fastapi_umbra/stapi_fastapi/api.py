@@ -1,6 +1,9 @@
-from fastapi import APIRouter, HTTPException, Request, status
+import hashlib
+from typing import Annotated
+
+from fastapi import APIRouter, HTTPException, Query, Request, status
 from fastapi.encoders import jsonable_encoder
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from stapi_fastapi.backend import StapiBackend
 from stapi_fastapi.constants import TYPE_GEOJSON, TYPE_JSON
 from stapi_fastapi.exceptions import ConstraintsException, NotFoundException
@@ -11,6 +14,12 @@ from stapi_fastapi.models.root import RootResponse
 from stapi_fastapi.models.shared import HTTPException as HTTPExceptionModel
 from stapi_fastapi.models.shared import Link
 
+from stapi_fastapi_umbra import formats
+from stapi_fastapi_umbra.cursors import Cursor, CursorNotFound, CursorStore
+from stapi_fastapi_umbra.opportunity_set import OpportunitySet
+
+MAX_PAGE_LIMIT = 10_000
+
 
 class StapiException(HTTPException):
     def __init__(self, status_code: int, detail: str) -> None:
@@ -22,6 +31,7 @@ class StapiRouter:
     backend: StapiBackend
     openapi_endpoint_name: str
     docs_endpoint_name: str
+    cursors: CursorStore
     router: APIRouter
 
     def __init__(
@@ -30,11 +40,13 @@ class StapiRouter:
         openapi_endpoint_name="openapi",
         docs_endpoint_name="swagger_ui_html",
         *args,
+        cursors: CursorStore | None = None,
         **kwargs,
     ):
         self.backend = backend
         self.openapi_endpoint_name = openapi_endpoint_name
         self.docs_endpoint_name = docs_endpoint_name
+        self.cursors = cursors or CursorStore()
 
         self.router = APIRouter(*args, **kwargs)
         self.router.add_api_route(
@@ -68,6 +80,13 @@ class StapiRouter:
             name=f"{self.NAME_PREFIX}:search-opportunities",
             tags=["Opportunities"],
         )
+        self.router.add_api_route(
+            "/opportunities/stats",
+            self.opportunity_stats,
+            methods=["POST"],
+            name=f"{self.NAME_PREFIX}:opportunity-stats",
+            tags=["Opportunities"],
+        )
 
         self.router.add_api_route(
             "/orders",
@@ -77,6 +96,20 @@ class StapiRouter:
             tags=["Orders"],
             response_model=Order,
         )
+        self.router.add_api_route(
+            "/orders/batch",
+            self.create_orders,
+            methods=["POST"],
+            name=f"{self.NAME_PREFIX}:create-orders",
+            tags=["Orders"],
+        )
+        self.router.add_api_route(
+            "/orders/events",
+            self.order_events,
+            methods=["GET"],
+            name=f"{self.NAME_PREFIX}:order-events",
+            tags=["Orders"],
+        )
         self.router.add_api_route(
             "/orders/{order_id}",
             self.get_order,
@@ -84,6 +117,13 @@ class StapiRouter:
             name=f"{self.NAME_PREFIX}:get-order",
             tags=["Orders"],
         )
+        self.router.add_api_route(
+            "/orders/{order_id}/events",
+            self.get_order_events,
+            methods=["GET"],
+            name=f"{self.NAME_PREFIX}:get-order-events",
+            tags=["Orders"],
+        )
 
     def root(self, request: Request) -> RootResponse:
         return RootResponse(
@@ -112,19 +152,10 @@ class StapiRouter:
         )
 
     def products(self, request: Request) -> ProductsCollection:
-        products = self.backend.products(request)
-        for product in products:
-            product.links.append(
-                Link(
-                    href=str(
-                        request.url_for(
-                            f"{self.NAME_PREFIX}:get-product", product_id=product.id
-                        )
-                    ),
-                    rel="self",
-                    type=TYPE_JSON,
-                )
-            )
+        products = [
+            self._with_self_link(product, request)
+            for product in self.backend.products(request)
+        ]
         return ProductsCollection(
             products=products,
             links=[
@@ -143,34 +174,140 @@ class StapiRouter:
             raise StapiException(
                 status.HTTP_404_NOT_FOUND, "product not found"
             ) from exc
-        product.links.append(
-            Link(
-                href=str(
-                    request.url_for(
-                        f"{self.NAME_PREFIX}:get-product", product_id=product.id
-                    )
-                ),
-                rel="self",
-                type=TYPE_JSON,
-            )
+        return self._with_self_link(product, request)
+
+    def _with_self_link(self, product: Product, request: Request) -> Product:
+        # Backends may return shared, long-lived Product objects, so add the
+        # link to a copy rather than appending to theirs on every request.
+        self_link = Link(
+            href=str(
+                request.url_for(f"{self.NAME_PREFIX}:get-product", product_id=product.id)
+            ),
+            rel="self",
+            type=TYPE_JSON,
         )
-        return product
+        return product.model_copy(update={"links": [*product.links, self_link]})
 
     async def search_opportunities(
-        self, search: OpportunityRequest, request: Request
+        self,
+        search: OpportunityRequest,
+        request: Request,
+        limit: Annotated[int | None, Query(ge=1, le=MAX_PAGE_LIMIT)] = None,
+        next: str | None = None,
     ) -> OpportunityCollection:
         """
-        Explore the opportunities available for a particular set of constraints
+        Explore the opportunities available for a particular set of constraints.
+
+        With `limit`, results are returned a page at a time with a `next` link
+        to the following page. The link's cursor records where the next page
+        starts, so each page only fetches the results it returns, and only
+        works with the same credentials and search body.
+
+        Results are GeoJSON unless the `Accept` header asks for an Arrow IPC
+        stream, GeoParquet or MessagePack.
         """
+        media_type = formats.negotiate(request.headers.get("Accept"))
+        if media_type is not None:
+            try:
+                formats.require(media_type)
+            except formats.FormatUnavailable as exc:
+                raise HTTPException(status.HTTP_406_NOT_ACCEPTABLE, detail=str(exc)) from exc
+
+        if limit is not None or next is not None:
+            opportunities, next_cursor = await self._search_page(search, request, limit, next)
+            return self._opportunities_page(
+                opportunities, next_cursor, search, request, media_type
+            )
+
         try:
             opportunities = await self.backend.search_opportunities(search, request)
         except ConstraintsException as exc:
             raise HTTPException(status.HTTP_422_UNPROCESSABLE_ENTITY, detail=exc.detail)
+        if isinstance(opportunities, OpportunitySet):
+            return self._opportunities_page(opportunities, None, search, request, media_type)
         return JSONResponse(
             jsonable_encoder(OpportunityCollection(features=opportunities)),
             media_type=TYPE_GEOJSON,
         )
 
+    async def _search_page(
+        self,
+        search: OpportunityRequest,
+        request: Request,
+        limit: int | None,
+        next: str | None,
+    ) -> tuple[OpportunitySet, str | None]:
+        owner = hashlib.sha256(request.headers.get("Authorization", "").encode()).hexdigest()
+        search_key = hashlib.sha256(search.model_dump_json().encode()).hexdigest()
+
+        position = None
+        if next is not None:
+            try:
+                cursor = await self.cursors.get(next, owner, search_key)
+            except CursorNotFound as exc:
+                raise HTTPException(status.HTTP_404_NOT_FOUND, detail=str(exc)) from exc
+            position, limit = cursor.position, limit or cursor.limit
+
+        try:
+            opportunities, next_position = await self.backend.search_opportunities_page(
+                search, request, limit, position
+            )
+        except ConstraintsException as exc:
+            raise HTTPException(status.HTTP_422_UNPROCESSABLE_ENTITY, detail=exc.detail)
+        if next_position is None:
+            return opportunities, None
+        next_cursor = await self.cursors.put(Cursor(owner, search_key, limit, next_position))
+        return opportunities, next_cursor
+
+    async def opportunity_stats(
+        self, search: OpportunityRequest, request: Request
+    ) -> JSONResponse:
+        """
+        Aggregate archive coverage statistics for a set of constraints
+        """
+        try:
+            stats = await self.backend.opportunity_stats(search, request)
+        except ConstraintsException as exc:
+            raise HTTPException(status.HTTP_422_UNPROCESSABLE_ENTITY, detail=exc.detail)
+        return JSONResponse(stats, media_type=TYPE_JSON)
+
+    def _opportunities_page(
+        self,
+        opportunities: OpportunitySet,
+        next_cursor: str | None,
+        search: OpportunityRequest,
+        request: Request,
+        media_type: str | None = None,
+    ) -> Response:
+        if media_type is not None:
+            # Columnar formats have nowhere to put links, so the next page is
+            # advertised in a Link header instead.
+            headers = {"Vary": "Accept"}
+            if next_cursor is not None:
+                next_url = request.url.include_query_params(next=next_cursor)
+                headers["Link"] = f'<{next_url}>; rel="next"'
+            return StreamingResponse(
+                formats.encode(opportunities, media_type),
+                media_type=media_type,
+                headers=headers,
+            )
+
+        links = []
+        if next_cursor is not None:
+            links.append(
+                Link(
+                    href=str(request.url.include_query_params(next=next_cursor)),
+                    rel="next",
+                    type=TYPE_GEOJSON,
+                    method="POST",
+                    body=jsonable_encoder(search),
+                )
+            )
+        return Response(
+            opportunities.to_geojson_bytes(links=jsonable_encoder(links, exclude_none=True)),
+            media_type=TYPE_GEOJSON,
+        )
+
     async def create_order(
         self, search: OpportunityRequest, request: Request
     ) -> JSONResponse:
@@ -193,6 +330,50 @@ class StapiRouter:
             TYPE_GEOJSON,
         )
 
+    async def create_orders(
+        self, searches: list[OpportunityRequest], request: Request
+    ) -> JSONResponse:
+        """
+        Create a batch of orders. Each item is reported individually and
+        failed items do not roll back the orders that were created.
+        """
+        results = await self.backend.create_orders(searches, request)
+
+        items = []
+        for result in results:
+            if isinstance(result, Order):
+                location = str(
+                    request.url_for(f"{self.NAME_PREFIX}:get-order", order_id=result.id)
+                )
+                result.links.append(Link(href=location, rel="self", type=TYPE_GEOJSON))
+                items.append(
+                    {
+                        "status": status.HTTP_201_CREATED,
+                        "location": location,
+                        "order": jsonable_encoder(result, exclude_unset=True),
+                    }
+                )
+            elif isinstance(result, HTTPException):
+                items.append({"status": result.status_code, "detail": result.detail})
+            elif isinstance(result, ConstraintsException):
+                items.append(
+                    {"status": status.HTTP_422_UNPROCESSABLE_ENTITY, "detail": result.detail}
+                )
+            else:
+                items.append(
+                    {
+                        "status": status.HTTP_500_INTERNAL_SERVER_ERROR,
+                        "detail": "unable to create order",
+                    }
+                )
+
+        all_created = all(item["status"] == status.HTTP_201_CREATED for item in items)
+        return JSONResponse(
+            {"results": items},
+            status.HTTP_201_CREATED if all_created else status.HTTP_207_MULTI_STATUS,
+            media_type=TYPE_JSON,
+        )
+
     async def get_order(self, order_id: str, request: Request) -> Order:
         """
         Get details for order with `order_id`.
@@ -209,3 +390,28 @@ class StapiRouter:
             status.HTTP_200_OK,
             media_type=TYPE_GEOJSON,
         )
+
+    def order_events(
+        self,
+        request: Request,
+        ids: Annotated[str, Query(description="Comma-separated order ids")],
+    ) -> StreamingResponse:
+        """
+        Stream status changes of several orders as Server-Sent Events.
+        """
+        order_ids = [order_id for order_id in ids.split(",") if order_id]
+        return self._event_stream(order_ids, request)
+
+    def get_order_events(self, order_id: str, request: Request) -> StreamingResponse:
+        """
+        Stream status changes of order with `order_id` as Server-Sent Events.
+        """
+        return self._event_stream([order_id], request)
+
+    def _event_stream(self, order_ids: list[str], request: Request) -> StreamingResponse:
+        events = self.backend.order_events(order_ids, request)
+        return StreamingResponse(
+            events,
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
@@ -0,0 +1,101 @@
+"""Archive coverage statistics
+
+Folds archive search pages into fixed-size histograms as they stream in, so
+memory stays constant however many scenes match and no `Opportunity`
+models are built.
+"""
+
+from datetime import datetime, timezone
+
+import numpy as np
+
+from stapi_fastapi_umbra.parameters import DEFAULT_SATELLITE_IDS
+
+GRAZING_ANGLE_BIN_EDGES = np.arange(0, 95, 5)
+TARGET_AZIMUTH_ANGLE_BIN_EDGES = np.arange(0, 390, 30)
+OTHER_PLATFORM = "other"
+
+
+def _month_index(dt: datetime) -> int:
+    """Months since 1970-01 in UTC, matching numpy's datetime64[M]"""
+    dt = dt.astimezone(timezone.utc)
+    return (dt.year - 1970) * 12 + dt.month - 1
+
+
+class ArchiveStats:
+    """Histograms of archive scenes per month, platform and viewing geometry"""
+
+    def __init__(
+        self, start: datetime, end: datetime, satellite_ids: list[str] = DEFAULT_SATELLITE_IDS
+    ) -> None:
+        self.start = start.timestamp()
+        self.end = end.timestamp()
+        self.first_month = _month_index(start)
+        self.months = np.zeros(_month_index(end) - self.first_month + 1, dtype=np.int64)
+        self.platforms = [*satellite_ids, OTHER_PLATFORM]
+        self.platform_counts = np.zeros(len(self.platforms), dtype=np.int64)
+        self.grazing_angle_counts = np.zeros(len(GRAZING_ANGLE_BIN_EDGES) - 1, dtype=np.int64)
+        self.target_azimuth_angle_counts = np.zeros(
+            len(TARGET_AZIMUTH_ANGLE_BIN_EDGES) - 1, dtype=np.int64
+        )
+        self.total = 0
+        # Scenes the archive returned that start outside [start, end]
+        self.out_of_range = 0
+        # Whether the archive search was cut short, leaving scenes uncounted
+        self.truncated = False
+
+    def add(self, features: list[dict]) -> None:
+        """Fold a page of STAC items into the histograms"""
+        starts = np.array(
+            [datetime.fromisoformat(f["properties"]["start_datetime"]).timestamp() for f in features]
+        )
+        in_range = (starts >= self.start) & (starts <= self.end)
+        props = [f["properties"] for f, keep in zip(features, in_range) if keep]
+        self.out_of_range += len(features) - len(props)
+        if not props:
+            return
+
+        # Months of the UTC timestamps, so scenes with offsets bin like the bounds
+        seconds = np.floor(starts[in_range]).astype(np.int64)
+        months = seconds.astype("datetime64[s]").astype("datetime64[M]")
+        month_bins = months.astype(np.int64) - self.first_month
+        self.months += np.bincount(month_bins, minlength=len(self.months))
+
+        platform_index = {p: i for i, p in enumerate(self.platforms)}
+        platforms = np.array(
+            [platform_index.get(p.get("platform"), len(self.platforms) - 1) for p in props]
+        )
+        self.platform_counts += np.bincount(platforms, minlength=len(self.platforms))
+
+        grazing = np.array([p["umbra:grazing_angle_degrees"] for p in props], dtype=np.float64)
+        self.grazing_angle_counts += np.histogram(grazing, GRAZING_ANGLE_BIN_EDGES)[0]
+
+        azimuth = np.array(
+            [p["umbra:target_azimuth_angle_degrees"] for p in props], dtype=np.float64
+        )
+        self.target_azimuth_angle_counts += np.histogram(
+            azimuth % 360, TARGET_AZIMUTH_ANGLE_BIN_EDGES
+        )[0]
+
+        self.total += len(props)
+
+    def to_dict(self) -> dict:
+        months = np.arange(self.first_month, self.first_month + len(self.months))
+        return {
+            "total": self.total,
+            "out_of_range": self.out_of_range,
+            "truncated": self.truncated,
+            "months": {
+                "start": np.datetime_as_string(months.astype("datetime64[M]")).tolist(),
+                "counts": self.months.tolist(),
+            },
+            "platforms": dict(zip(self.platforms, self.platform_counts.tolist())),
+            "grazing_angle_degrees": {
+                "bin_edges": GRAZING_ANGLE_BIN_EDGES.tolist(),
+                "counts": self.grazing_angle_counts.tolist(),
+            },
+            "target_azimuth_angle_degrees": {
+                "bin_edges": TARGET_AZIMUTH_ANGLE_BIN_EDGES.tolist(),
+                "counts": self.target_azimuth_angle_counts.tolist(),
+            },
+        }
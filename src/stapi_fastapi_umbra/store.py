@@ -0,0 +1,192 @@
+"""Persistent cache tier shared across workers
+
+Archive pages and feasibility buckets are kept in a SQLite database in WAL
+mode at the path given by `Settings.database`, so every uvicorn worker
+reads the same hot data and the cache survives restarts. WAL allows
+concurrent readers alongside a single writer across processes, and reads
+are served through a memory-mapped view of the database file.
+
+SQLite calls block, for up to the busy timeout while another process holds
+the write lock, so the event loop uses `read` and `write`, which batch
+lookups into a single query and run in a worker thread.
+"""
+
+import asyncio
+import logging
+import random
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import NamedTuple
+
+from stapi_fastapi_umbra.metrics import metrics
+from stapi_fastapi_umbra.settings import Settings
+
+logger = logging.getLogger(__name__)
+
+METRICS_TENANT = "disk-cache"
+
+# Keys per query, below SQLite's default limit on bound parameters.
+MAX_KEYS_PER_QUERY = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value BLOB NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS cache_expires_at ON cache (expires_at);
+"""
+
+
+class CacheEntry(NamedTuple):
+    value: bytes
+    expires_at: float
+
+
+def sqlite_path(database: str) -> Path | None:
+    """
+    The file path of a `sqlite:///path` database URL, or `None` for an
+    in-memory (`sqlite://`) or non-SQLite database.
+    """
+    prefix = "sqlite:///"
+    if not database.startswith(prefix) or database == prefix:
+        return None
+    return Path(database.removeprefix(prefix))
+
+
+class DiskCache:
+    """TTL'd key/value cache in a SQLite WAL database"""
+
+    def __init__(self, path: str | Path, mmap_size: int = 256 * 1024 * 1024) -> None:
+        self.path = Path(path)
+        self.mmap_size = mmap_size
+        self._local = threading.local()
+        self._compactor: threading.Thread | None = None
+        self._stop = threading.Event()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        connection = self._connection()
+        connection.executescript(SCHEMA)
+        if connection.execute("PRAGMA auto_vacuum").fetchone()[0] == 0:
+            # A database created without auto_vacuum only switches on VACUUM.
+            try:
+                connection.execute("VACUUM")
+            except sqlite3.OperationalError:
+                logger.warning("unable to enable auto_vacuum on the disk cache")
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "DiskCache | None":
+        path = sqlite_path(settings.database)
+        if path is None:
+            return None
+        cache = cls(path, mmap_size=settings.disk_cache_mmap_size)
+        cache.start_compaction(settings.disk_cache_compaction_interval)
+        return cache
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections can't be shared between threads, so each thread
+        # (the event loop, the compactor, any executor) gets its own.
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            # auto_vacuum must be set before anything is written to a new
+            # database, including the switch to WAL.
+            connection.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+            self._local.connection = connection
+        return connection
+
+    def get_many(self, namespace: str, keys: list[str]) -> dict[str, CacheEntry]:
+        """Unexpired entries for `keys`, by key"""
+        now = time.time()
+        found = {}
+        try:
+            connection = self._connection()
+            for i in range(0, len(keys), MAX_KEYS_PER_QUERY):
+                chunk = keys[i : i + MAX_KEYS_PER_QUERY]
+                rows = connection.execute(
+                    "SELECT key, value, expires_at FROM cache"
+                    " WHERE namespace = ? AND expires_at > ?"
+                    f" AND key IN ({', '.join('?' * len(chunk))})",
+                    (namespace, now, *chunk),
+                )
+                found.update((key, CacheEntry(value, expires_at)) for key, value, expires_at in rows)
+        except sqlite3.OperationalError:
+            # Locked past the busy timeout; the cache is best-effort so treat
+            # it as a miss.
+            logger.warning(f"unable to read {namespace} entries from disk cache")
+            return {}
+        return found
+
+    def set_many(self, namespace: str, entries: list[tuple[str, bytes, float]]) -> None:
+        """Store `(key, value, ttl)` entries in a single transaction"""
+        now = time.time()
+        connection = self._connection()
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            connection.executemany(
+                "INSERT OR REPLACE INTO cache (namespace, key, value, expires_at)"
+                " VALUES (?, ?, ?, ?)",
+                [(namespace, key, value, now + ttl) for key, value, ttl in entries],
+            )
+            connection.execute("COMMIT")
+        except sqlite3.OperationalError:
+            # Another process held the write lock past the busy timeout;
+            # the cache is best-effort so drop the write.
+            if connection.in_transaction:
+                connection.execute("ROLLBACK")
+            logger.warning(f"unable to write {namespace} entries to disk cache")
+
+    async def read(self, namespace: str, keys: list[str]) -> dict[str, CacheEntry]:
+        """`get_many` in a worker thread"""
+        found = await asyncio.to_thread(self.get_many, namespace, keys)
+        metrics.increment(METRICS_TENANT, f"{namespace}_hits", len(found))
+        metrics.increment(METRICS_TENANT, f"{namespace}_misses", len(keys) - len(found))
+        return found
+
+    async def write(self, namespace: str, entries: list[tuple[str, bytes, float]]) -> None:
+        """`set_many` in a worker thread"""
+        await asyncio.to_thread(self.set_many, namespace, entries)
+
+    def compact(self) -> int:
+        """Delete expired entries and return their space to the filesystem"""
+        connection = self._connection()
+        deleted = connection.execute(
+            "DELETE FROM cache WHERE expires_at <= ?", (time.time(),)
+        ).rowcount
+        connection.execute("PRAGMA incremental_vacuum")
+        connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return deleted
+
+    def _compact_forever(self, interval: float) -> None:
+        # Jitter so that workers started together don't all compact at once.
+        while not self._stop.wait(interval * random.uniform(0.5, 1.5)):
+            try:
+                deleted = self.compact()
+                logger.debug(f"compacted disk cache, {deleted} expired entries removed")
+            except sqlite3.Error:
+                logger.exception("disk cache compaction failed")
+
+    def start_compaction(self, interval: float) -> None:
+        if self._compactor is not None:
+            return
+        self._compactor = threading.Thread(
+            target=self._compact_forever,
+            args=(interval,),
+            name="disk-cache-compactor",
+            daemon=True,
+        )
+        self._compactor.start()
+
+    def close(self) -> None:
+        self._stop.set()
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
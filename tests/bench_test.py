@@ -0,0 +1,13 @@
+import io
+
+import pytest
+from stapi_fastapi_umbra.bench import BENCHMARKS, run
+
+
+@pytest.mark.parametrize("name", list(BENCHMARKS))
+def test_benchmark_runs(name: str):
+    output = io.StringIO()
+    results = run([name], scale=0.01, file=output)
+
+    assert results[name]
+    assert output.getvalue().count("\n") == len(results[name])
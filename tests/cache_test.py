@@ -0,0 +1,109 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from stapi_fastapi_umbra.cache import FeasibilityCache
+from stapi_fastapi_umbra.models import SpotlightConstraints, UmbraOpportunity
+from stapi_fastapi_umbra.store import DiskCache
+
+START = datetime(2030, 1, 1, tzinfo=timezone.utc)
+CONSTRAINTS = SpotlightConstraints(geometry={"type": "Point", "coordinates": [-112.146, 40.522]})
+
+
+class Fetcher:
+    """Feasibility fetcher returning one opportunity per hour, recording its calls"""
+
+    def __init__(self) -> None:
+        self.calls: list[tuple[datetime, datetime]] = []
+
+    async def __call__(
+        self, constraints: SpotlightConstraints, start: datetime, end: datetime
+    ) -> list[UmbraOpportunity]:
+        self.calls.append((start, end))
+        hour = timedelta(hours=1)
+        first = START + (start - START) // hour * hour + timedelta(minutes=10)
+        windows = [first + h * hour for h in range(-(-(end - first) // hour))]
+        return [
+            UmbraOpportunity(
+                windowStartAt=window,
+                windowEndAt=window + timedelta(minutes=1),
+                durationSec=60,
+                grazingAngleStartDegrees=40,
+                grazingAngleEndDegrees=50,
+                targetAzimuthAngleStartDegrees=0,
+                targetAzimuthAngleEndDegrees=10,
+                satelliteId="Umbra-04",
+            )
+            for window in windows
+            if start <= window < end
+        ]
+
+
+def test_sliding_window_fetches_only_uncovered_buckets():
+    cache = FeasibilityCache()
+    fetch = Fetcher()
+
+    first = asyncio.run(
+        cache.get_opportunities(CONSTRAINTS, START, START + timedelta(days=1), fetch, "a")
+    )
+    later = START + timedelta(hours=6)
+    second = asyncio.run(
+        cache.get_opportunities(CONSTRAINTS, later, later + timedelta(days=1), fetch, "a")
+    )
+
+    assert len(first) == len(second) == 24
+    assert fetch.calls == [
+        (START, START + timedelta(days=1)),
+        (START + timedelta(days=1), later + timedelta(days=1)),
+    ]
+
+
+def test_partly_requested_bucket_is_fetched_from_start_and_not_cached():
+    cache = FeasibilityCache()
+    fetch = Fetcher()
+    start = START + timedelta(minutes=5)
+    end = START + timedelta(hours=3)
+
+    first = asyncio.run(cache.get_opportunities(CONSTRAINTS, start, end, fetch, "a"))
+    second = asyncio.run(cache.get_opportunities(CONSTRAINTS, start, end, fetch, "a"))
+    aligned = asyncio.run(cache.get_opportunities(CONSTRAINTS, START, end, fetch, "a"))
+
+    assert len(first) == len(second) == len(aligned) == 3
+    assert fetch.calls == [
+        (start, end),
+        (start, START + timedelta(hours=1)),
+        (START, START + timedelta(hours=1)),
+    ]
+
+
+def test_buckets_are_not_shared_between_tenants():
+    cache = FeasibilityCache()
+    fetch = Fetcher()
+    end = START + timedelta(hours=3)
+
+    asyncio.run(cache.get_opportunities(CONSTRAINTS, START, end, fetch, "a"))
+    asyncio.run(cache.get_opportunities(CONSTRAINTS, START, end, fetch, "b"))
+    asyncio.run(cache.get_opportunities(CONSTRAINTS, START, end, fetch, "a"))
+
+    assert len(fetch.calls) == 2
+
+
+def test_buckets_are_shared_through_the_disk_tier(tmp_path: Path):
+    store = DiskCache(tmp_path / "cache.db")
+    fetch = Fetcher()
+    end = START + timedelta(days=7)
+
+    first = asyncio.run(
+        FeasibilityCache(store=store).get_opportunities(CONSTRAINTS, START, end, fetch, "a")
+    )
+    # Another worker's cache, empty in memory
+    second = asyncio.run(
+        FeasibilityCache(store=store).get_opportunities(CONSTRAINTS, START, end, fetch, "a")
+    )
+    other_tenant = asyncio.run(
+        FeasibilityCache(store=store).get_opportunities(CONSTRAINTS, START, end, fetch, "b")
+    )
+    store.close()
+
+    assert second == first == other_tenant
+    assert len(fetch.calls) == 2
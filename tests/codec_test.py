@@ -0,0 +1,11 @@
+from stapi_fastapi_umbra.codec import read_status
+
+
+def test_read_status_ignores_nested_members():
+    content = b'{"feasibilityRequest":{"status":"X"},"id":"1","status":"COMPLETED"}'
+    assert read_status(content) == "COMPLETED"
+
+
+def test_read_status_without_status():
+    assert read_status(b'{"id":"1","opportunities":[{"status":"X"}]}') is None
+    assert read_status(b'{"id": "1", "status": "PROCESSING"}') == "PROCESSING"
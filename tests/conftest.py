@@ -0,0 +1,18 @@
+from collections.abc import Iterator
+
+import pytest
+from fastapi.testclient import TestClient
+from stapi_fastapi_umbra import client
+from stapi_fastapi_umbra.soak import TOKEN, CanopyStub, build_app
+
+
+@pytest.fixture
+def stub() -> CanopyStub:
+    return CanopyStub()
+
+
+@pytest.fixture
+def api(stub: CanopyStub) -> Iterator[TestClient]:
+    client.feasibility_cache.clear()
+    with TestClient(build_app(stub), headers={"Authorization": f"Bearer {TOKEN}"}) as api:
+        yield api
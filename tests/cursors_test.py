@@ -0,0 +1,42 @@
+import asyncio
+from pathlib import Path
+
+import pytest
+from stapi_fastapi_umbra.cursors import Cursor, CursorNotFound, CursorStore
+from stapi_fastapi_umbra.store import DiskCache
+
+CURSOR = Cursor(owner="alice", search="search", limit=10, position={"archive_offset": 3})
+
+
+def test_cursor_is_readable_from_another_worker(tmp_path: Path):
+    store = DiskCache(tmp_path / "cache.db")
+    token = asyncio.run(CursorStore(store=store).put(CURSOR))
+    cursor = asyncio.run(CursorStore(store=store).get(token, "alice", "search"))
+    store.close()
+
+    assert cursor == CURSOR
+
+
+def test_cursor_results_are_stored_with_it(tmp_path: Path):
+    store = DiskCache(tmp_path / "cache.db")
+    cursor = Cursor("alice", "search", 10, {"archive_offset": 3, "archive_page": b'{"x":1}'})
+    token = asyncio.run(CursorStore(store=store).put(cursor))
+    read = asyncio.run(CursorStore(store=store).get(token, "alice", "search"))
+    store.close()
+
+    assert read == cursor
+
+
+@pytest.mark.parametrize("owner,search", [("bob", "search"), ("alice", "other")])
+def test_cursor_is_only_valid_for_its_owner_and_search(owner: str, search: str):
+    cursors = CursorStore()
+    token = asyncio.run(cursors.put(CURSOR))
+    with pytest.raises(CursorNotFound):
+        asyncio.run(cursors.get(token, owner, search))
+
+
+def test_expired_cursor_is_not_found():
+    cursors = CursorStore(ttl=0)
+    token = asyncio.run(cursors.put(CURSOR))
+    with pytest.raises(CursorNotFound):
+        asyncio.run(cursors.get(token, "alice", "search"))
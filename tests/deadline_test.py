@@ -0,0 +1,76 @@
+import time
+from datetime import datetime, timedelta, timezone
+from uuid import uuid4
+
+import pytest
+from fastapi import Request
+from fastapi.testclient import TestClient
+from stapi_fastapi_umbra import deadline
+from stapi_fastapi_umbra.backend import settings
+from stapi_fastapi_umbra.client import tenant_id
+from stapi_fastapi_umbra.metrics import metrics
+from stapi_fastapi_umbra.soak import POINT, TOKEN, CanopyStub
+
+START = datetime.now(tz=timezone.utc) + timedelta(days=1)
+ORDER = {
+    "geometry": POINT,
+    "datetime": f"{START.isoformat()}/{(START + timedelta(minutes=15)).isoformat()}",
+    "product_id": "umbra_spotlight",
+}
+
+
+@pytest.fixture
+def stub() -> CanopyStub:
+    # Creating an order is one task request.
+    return CanopyStub(latency=0.3)
+
+
+def test_slow_canopy_is_a_gateway_timeout(api: TestClient):
+    response = api.get(f"/orders/{uuid4()}", headers={"Request-Timeout": "0.1"})
+
+    assert response.status_code == 504
+    assert "Canopy did not respond in time" in response.json()["detail"]
+
+
+def test_batch_items_share_the_batch_deadline(api: TestClient, monkeypatch):
+    monkeypatch.setattr(settings, "order_batch_concurrency", 1)
+    monkeypatch.setattr(settings, "order_batch_timeout", 0.45)
+
+    response = api.post("/orders/batch", json=[ORDER] * 3)
+
+    assert response.status_code == 207
+    results = response.json()["results"]
+    assert [item["status"] for item in results] == [201, 504, 504]
+    # Items started late are bounded by what's left of the batch deadline,
+    # so their own Canopy calls time out rather than being cut off.
+    assert all("Canopy did not respond in time" in item["detail"] for item in results[1:])
+
+
+def test_disconnect_cancels_upstream_work(
+    api: TestClient, stub: CanopyStub, monkeypatch: pytest.MonkeyPatch
+):
+    async def is_disconnected(self) -> bool:
+        # Gone once the feasibility job has been created
+        return stub.requests >= 1
+
+    monkeypatch.setattr(Request, "is_disconnected", is_disconnected)
+    monkeypatch.setattr(deadline, "DISCONNECT_POLL_SECONDS", 0.01)
+    tenant = tenant_id(TOKEN)
+    cancelled = metrics.snapshot().get(tenant, {}).get("cancelled_disconnect", 0)
+
+    response = api.post("/opportunities", json=ORDER)
+    time.sleep(0.5)
+
+    assert response.status_code == 499
+    assert stub.requests == 1
+    assert metrics.snapshot()[tenant]["cancelled_disconnect"] == cancelled + 1
+
+
+@pytest.mark.parametrize(
+    "header,expected",
+    [(None, 60), ("2.5", 2.5), ("-1", 0), ("1e9", 300), ("soon", 60), ("nan", 60), ("inf", 60)],
+)
+def test_request_timeout(header: str | None, expected: float):
+    headers = [] if header is None else [(b"request-timeout", header.encode())]
+    request = Request({"type": "http", "headers": headers})
+    assert deadline.request_timeout(request, 60, 300) == expected
@@ -0,0 +1,170 @@
+import asyncio
+import json
+from types import SimpleNamespace
+from uuid import uuid4
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from stapi_fastapi_umbra.backend import settings
+from stapi_fastapi_umbra.events import Subscriber, TaskEvents, TaskPoller
+
+TASK_ID = str(uuid4())
+
+
+class Upstream:
+    """Task statuses Canopy reports on successive polls; ints are error codes"""
+
+    def __init__(self, statuses: list[str | int]) -> None:
+        self.statuses = statuses
+        self.polls = 0
+
+    async def poll(self, poller: TaskPoller) -> dict:
+        status = self.statuses[min(self.polls, len(self.statuses) - 1)]
+        self.polls += 1
+        if isinstance(status, int):
+            request = httpx.Request("GET", f"https://canopy/tasks/{poller.task_id}")
+            response = httpx.Response(status, request=request)
+            raise httpx.HTTPStatusError("error", request=request, response=response)
+        return {"id": poller.task_id, "status": status, "order": {}}
+
+
+def upstream(monkeypatch: pytest.MonkeyPatch, statuses: list[str | int]) -> Upstream:
+    canopy = Upstream(statuses)
+    monkeypatch.setattr(TaskPoller, "_poll", lambda poller: canopy.poll(poller))
+    return canopy
+
+
+def client(tenant: str = "tenant-a") -> SimpleNamespace:
+    return SimpleNamespace(tenant=tenant)
+
+
+def task_events() -> TaskEvents:
+    return TaskEvents(min_interval=0.01, max_interval=0.01)
+
+
+async def drain(subscriber: Subscriber) -> list[dict | None]:
+    """Events up to and including the end of the stream"""
+    events = []
+    while not events or events[-1] is not None:
+        events.append((await asyncio.wait_for(subscriber.get(), timeout=1))[1])
+    return events
+
+
+def test_subscribers_share_a_poller(monkeypatch: pytest.MonkeyPatch):
+    canopy = upstream(monkeypatch, ["ACCEPTED"])
+
+    async def run():
+        events = task_events()
+        first, second, other = asyncio.Queue(), asyncio.Queue(), asyncio.Queue()
+        events.subscribe(client(), TASK_ID, first)
+        events.subscribe(client(), TASK_ID, second)
+        events.subscribe(client("tenant-b"), TASK_ID, other)
+        received = [(await q.get())[1]["status"] for q in (first, second, other)]
+        await asyncio.sleep(0.05)
+        pollers = len(events._pollers)
+        for q, tenant in ((first, "tenant-a"), (second, "tenant-a"), (other, "tenant-b")):
+            events.unsubscribe(client(tenant), TASK_ID, q)
+        return received, pollers, first.empty()
+
+    received, pollers, unchanged = asyncio.run(run())
+
+    assert received == ["ACCEPTED"] * 3
+    # One poller per credential, and no repeats of an unchanged status
+    assert pollers == 2
+    assert unchanged
+    assert canopy.polls > 2
+
+
+def test_late_subscriber_gets_the_last_event(monkeypatch: pytest.MonkeyPatch):
+    upstream(monkeypatch, ["ACCEPTED"])
+
+    async def run():
+        events = task_events()
+        first, late = asyncio.Queue(), asyncio.Queue()
+        events.subscribe(client(), TASK_ID, first)
+        await first.get()
+        events.subscribe(client(), TASK_ID, late)
+        event = late.get_nowait()
+        events.unsubscribe(client(), TASK_ID, first)
+        events.unsubscribe(client(), TASK_ID, late)
+        return event
+
+    assert asyncio.run(run()) == (TASK_ID, {"id": TASK_ID, "status": "ACCEPTED", "order": {}})
+
+
+def test_poller_is_cancelled_when_the_last_subscriber_leaves(monkeypatch: pytest.MonkeyPatch):
+    canopy = upstream(monkeypatch, ["ACCEPTED"])
+
+    async def run():
+        events = task_events()
+        first, second = asyncio.Queue(), asyncio.Queue()
+        events.subscribe(client(), TASK_ID, first)
+        events.subscribe(client(), TASK_ID, second)
+        poller = events._pollers[(client().tenant, TASK_ID)]
+        await first.get()
+
+        events.unsubscribe(client(), TASK_ID, first)
+        await asyncio.sleep(0.05)
+        assert not poller.task.done()
+
+        events.unsubscribe(client(), TASK_ID, second)
+        await asyncio.sleep(0)
+        polls = canopy.polls
+        await asyncio.sleep(0.05)
+        return poller, polls, events._pollers
+
+    poller, polls, pollers = asyncio.run(run())
+
+    assert poller.task.cancelled()
+    assert canopy.polls == polls
+    assert pollers == {}
+
+
+@pytest.mark.parametrize(
+    "statuses,expected",
+    [
+        (["ACCEPTED", "ACCEPTED", "DELIVERED"], ["ACCEPTED", "DELIVERED"]),
+        ([404], [{"id": TASK_ID, "error": "Not Found"}]),
+    ],
+)
+def test_polling_stops_at_the_end_of_the_stream(
+    monkeypatch: pytest.MonkeyPatch, statuses: list[str | int], expected: list
+):
+    canopy = upstream(monkeypatch, statuses)
+
+    async def run():
+        events = task_events()
+        subscriber = asyncio.Queue()
+        events.subscribe(client(), TASK_ID, subscriber)
+        received = await drain(subscriber)
+        await asyncio.sleep(0.05)
+        return received, events._pollers
+
+    received, pollers = asyncio.run(run())
+
+    assert [e["status"] if "status" in e else e for e in received[:-1]] == expected
+    assert received[-1] is None
+    assert canopy.polls == len(statuses)
+    assert pollers == {}
+
+
+def test_order_events_stream(api: TestClient):
+    response = api.get(f"/orders/events?ids={TASK_ID}")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    event, id, data = response.text.strip().split("\n")
+    assert event == "event: status"
+    assert id == f"id: {TASK_ID}"
+    assert json.loads(data.removeprefix("data: "))["status"] == "DELIVERED"
+
+
+@pytest.mark.parametrize(
+    "ids,status_code", [("", 400), (",", 400), ("not-a-uuid", 404), (",".join([TASK_ID] * 3), 422)]
+)
+def test_order_events_ids_are_validated(
+    api: TestClient, monkeypatch: pytest.MonkeyPatch, ids: str, status_code: int
+):
+    monkeypatch.setattr(settings, "order_events_max_ids", 2)
+    assert api.get(f"/orders/events?ids={ids}").status_code == status_code
@@ -0,0 +1,134 @@
+import io
+import json
+from datetime import datetime, timedelta, timezone
+
+import msgpack
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from fastapi.testclient import TestClient
+from stapi_fastapi_umbra import formats
+from stapi_fastapi_umbra.formats import ARROW_STREAM, GEOPARQUET, MSGPACK, negotiate
+from stapi_fastapi_umbra.soak import POINT, CanopyStub
+
+NOW = datetime.now(tz=timezone.utc)
+ARCHIVE_SEARCH = {
+    "geometry": POINT,
+    "datetime": f"{(NOW - timedelta(days=30)).isoformat()}/{(NOW - timedelta(days=1)).isoformat()}",
+    "product_id": "umbra_spotlight",
+}
+
+
+@pytest.fixture
+def stub() -> CanopyStub:
+    return CanopyStub(archive_items=12, archive_page_size=5)
+
+
+def rows(media_type: str, content: bytes) -> int:
+    """The number of opportunities in a columnar response"""
+    if media_type == ARROW_STREAM:
+        return pa.ipc.open_stream(content).read_all().num_rows
+    if media_type == GEOPARQUET:
+        return pq.read_table(io.BytesIO(content)).num_rows
+    return len(msgpack.unpackb(content)["columns"]["start_datetime"])
+
+
+@pytest.mark.parametrize(
+    "accept,expected",
+    [
+        (None, None),
+        ("", None),
+        ("*/*", None),
+        (ARROW_STREAM, ARROW_STREAM),
+        ("application/x-msgpack", MSGPACK),
+        ("Application/Vnd.Apache.Parquet", GEOPARQUET),
+        (f"application/geo+json, {ARROW_STREAM}", None),
+        (f"application/geo+json;q=0.5, {ARROW_STREAM}", ARROW_STREAM),
+        (f"{MSGPACK};q=0.8, {GEOPARQUET};q=0.9", GEOPARQUET),
+        (f"{ARROW_STREAM};q=0, application/json", None),
+        (f"{ARROW_STREAM};q=high, {MSGPACK}", MSGPACK),
+        ("text/html, application/x-parquet", GEOPARQUET),
+    ],
+)
+def test_negotiate(accept: str | None, expected: str | None):
+    assert negotiate(accept) == expected
+
+
+def test_arrow_stream(api: TestClient):
+    response = api.post("/opportunities", json=ARCHIVE_SEARCH, headers={"Accept": ARROW_STREAM})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == ARROW_STREAM
+    table = pa.ipc.open_stream(response.content).read_all()
+    assert table.num_rows == 5
+    geometry = table.schema.field("geometry")
+    assert geometry.metadata[b"ARROW:extension:name"] == b"geoarrow.wkb"
+    for name in ("product_id", "satellite_id", "imaging_mode", "order_href"):
+        assert pa.types.is_dictionary(table.schema.field(name).type)
+    assert table.column("archive_id").to_pylist() == [f"archive-{i}" for i in range(5)]
+
+
+def test_geoparquet(api: TestClient):
+    response = api.post("/opportunities", json=ARCHIVE_SEARCH, headers={"Accept": GEOPARQUET})
+
+    assert response.status_code == 200
+    table = pq.read_table(io.BytesIO(response.content))
+    assert table.num_rows == 5
+    geo = json.loads(table.schema.metadata[b"geo"])
+    assert geo["primary_column"] == "geometry"
+    assert geo["columns"]["geometry"]["encoding"] == "WKB"
+    assert geo["columns"]["geometry"]["geometry_types"] == ["Polygon"]
+    assert len(geo["columns"]["geometry"]["bbox"]) == 4
+
+
+def test_msgpack(api: TestClient):
+    response = api.post("/opportunities", json=ARCHIVE_SEARCH, headers={"Accept": MSGPACK})
+
+    assert response.status_code == 200
+    content = msgpack.unpackb(response.content)
+    assert content["product_id"] == "umbra_spotlight"
+    assert {len(column) for column in content["columns"].values()} == {5}
+
+
+@pytest.mark.parametrize("media_type", [ARROW_STREAM, GEOPARQUET, MSGPACK])
+def test_columnar_pages_link_to_the_next(api: TestClient, media_type: str):
+    headers = {"Accept": media_type}
+    response = api.post("/opportunities?limit=4", json=ARCHIVE_SEARCH, headers=headers)
+    counts = []
+    while True:
+        assert response.status_code == 200, response.text
+        counts.append(rows(media_type, response.content))
+        if "Link" not in response.headers:
+            break
+        url, rel = response.headers["Link"].split("; ")
+        assert rel == 'rel="next"'
+        response = api.post(url.strip("<>"), json=ARCHIVE_SEARCH, headers=headers)
+
+    assert counts == [4, 4, 4]
+
+
+@pytest.mark.parametrize("media_type", [ARROW_STREAM, GEOPARQUET, MSGPACK])
+def test_empty_result_set(api: TestClient, stub: CanopyStub, media_type: str):
+    stub.archive_items = stub.archive_page_size = 0
+    response = api.post("/opportunities", json=ARCHIVE_SEARCH, headers={"Accept": media_type})
+
+    assert response.status_code == 200
+    assert rows(media_type, response.content) == 0
+
+
+@pytest.mark.parametrize(
+    "media_type,module,package",
+    [
+        (ARROW_STREAM, "pa", "pyarrow"),
+        (GEOPARQUET, "pa", "pyarrow"),
+        (MSGPACK, "msgpack", "msgpack"),
+    ],
+)
+def test_missing_library_is_not_acceptable(
+    api: TestClient, monkeypatch: pytest.MonkeyPatch, media_type: str, module: str, package: str
+):
+    monkeypatch.setattr(formats, module, None)
+    response = api.post("/opportunities", json=ARCHIVE_SEARCH, headers={"Accept": media_type})
+
+    assert response.status_code == 406
+    assert response.json()["detail"] == f"install {package} to receive {media_type}"
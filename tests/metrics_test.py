@@ -0,0 +1,60 @@
+import asyncio
+
+from stapi_fastapi_umbra.metrics import Metrics
+from stapi_fastapi_umbra.scheduler import FairScheduler
+
+
+def test_least_recently_seen_tenants_are_evicted():
+    metrics = Metrics(max_tenants=2)
+    metrics.observe_latency("a", 0.1)
+    metrics.observe_latency("b", 0.1)
+    metrics.increment("a", "errors")
+    metrics.observe_latency("c", 0.1)
+
+    assert sorted(metrics.snapshot()) == ["a", "c"]
+    assert metrics.snapshot()["a"]["errors"] == 1
+
+
+def test_tenants_with_queued_calls_are_kept():
+    metrics = Metrics(max_tenants=1)
+    metrics.queue_changed("a", 1)
+    metrics.observe_latency("b", 0.1)
+    metrics.queue_changed("a", -1)
+
+    assert sorted(metrics.snapshot()) == ["a", "b"]
+    metrics.observe_latency("c", 0.1)
+    assert sorted(metrics.snapshot()) == ["c"]
+
+
+def test_scheduler_alternates_between_tenants():
+    async def run() -> list[str]:
+        scheduler = FairScheduler(concurrency=1, metrics=Metrics())
+        order: list[str] = []
+
+        async def call(tenant: str) -> None:
+            async with scheduler.slot(tenant):
+                order.append(tenant)
+                await asyncio.sleep(0)
+
+        await asyncio.gather(*(call("flood") for _ in range(6)), call("a"), call("b"))
+        return order
+
+    order = asyncio.run(run())
+    assert order.index("a") <= 2 and order.index("b") <= 3
+
+
+def test_scheduler_shares_slots_by_weight():
+    async def run() -> list[str]:
+        scheduler = FairScheduler(concurrency=1, weights={"heavy": 2.0}, metrics=Metrics())
+        order: list[str] = []
+
+        async def call(tenant: str) -> None:
+            async with scheduler.slot(tenant):
+                order.append(tenant)
+                await asyncio.sleep(0)
+
+        await asyncio.gather(*(call(t) for t in ["light", "heavy"] * 12))
+        return order
+
+    order = asyncio.run(run())
+    assert order[:12].count("heavy") == 8
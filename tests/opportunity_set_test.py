@@ -0,0 +1,122 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+from stapi_fastapi.models.opportunity import Opportunity
+from stapi_fastapi_umbra.opportunities import (
+    ARCHIVE_ORDER_LINK,
+    TASK_ORDER_LINK,
+    stac_items_to_opportunity_set,
+)
+from stapi_fastapi_umbra.opportunity_set import (
+    OpportunitySet,
+    OpportunitySetBuilder,
+    to_micros,
+)
+from stapi_fastapi_umbra.soak import CanopyStub
+
+START = datetime(2030, 1, 1, tzinfo=timezone.utc)
+POINT = {"type": "Point", "coordinates": [-112.146, 40.522]}
+POLYGON = {
+    "type": "Polygon",
+    "coordinates": [[[0.0, 0.0], [1.0, 0.0], [1.0, 1.0], [0.0, 1.0], [0.0, 0.0]]],
+}
+
+
+def build(rows: list[tuple[int, str, str]], product_id: str = "umbra_spotlight") -> OpportunitySet:
+    """A set with one opportunity per (hour, satellite, kind) row"""
+    builder = OpportunitySetBuilder(product_id)
+    for hour, satellite_id, kind in rows:
+        start = START + timedelta(hours=hour)
+        archive = kind == "archive"
+        builder.append(
+            start=start,
+            end=start + timedelta(seconds=30),
+            duration=30.0,
+            grazing=(40.0, 50.0),
+            azimuth=(10.0, 20.0),
+            satellite_id=satellite_id,
+            imaging_mode="SPOTLIGHT_ARCHIVE" if archive else "SPOTLIGHT",
+            geometry=builder.intern_geometry(POLYGON if archive else POINT),
+            link=ARCHIVE_ORDER_LINK if archive else TASK_ORDER_LINK,
+            item_id=f"item-{hour}" if archive else None,
+        )
+    return builder.build()
+
+
+def hours(opportunities: OpportunitySet) -> list[int]:
+    return ((opportunities.start - to_micros(START)) // 3_600_000_000).tolist()
+
+
+def test_concat_merges_lookup_tables():
+    first = build([(0, "Umbra-04", "task"), (1, "Umbra-05", "task")])
+    second = build([(2, "Umbra-05", "archive"), (3, "Umbra-06", "task")])
+
+    merged = OpportunitySet.concat([first, second])
+
+    assert len(merged) == 4
+    assert merged.satellite_ids().tolist() == ["Umbra-04", "Umbra-05", "Umbra-05", "Umbra-06"]
+    assert merged.satellites == ("Umbra-04", "Umbra-05", "Umbra-06")
+    assert len(merged.geometries) == len(merged.link_templates) == 2
+    assert merged.item_id.tolist() == [None, None, "item-2", None]
+    assert merged.to_opportunities() == first.to_opportunities() + second.to_opportunities()
+
+
+def test_concat_rejects_mixed_products_and_empty_input():
+    with pytest.raises(ValueError):
+        OpportunitySet.concat([])
+    with pytest.raises(ValueError):
+        OpportunitySet.concat([build([]), build([], product_id="other")])
+
+
+def test_concat_with_empty_sets():
+    opportunities = build([(0, "Umbra-04", "task")])
+    merged = OpportunitySet.concat([OpportunitySet.empty("umbra_spotlight"), opportunities])
+    assert merged.to_opportunities() == opportunities.to_opportunities()
+
+
+def test_take_filter_and_sort():
+    opportunities = build(
+        [(3, "Umbra-04", "task"), (1, "Umbra-05", "archive"), (2, "Umbra-06", "task")]
+    )
+
+    assert opportunities.take(slice(1, None)).satellite_ids().tolist() == ["Umbra-05", "Umbra-06"]
+    assert opportunities.take(np.array([2, 0])).satellite_ids().tolist() == [
+        "Umbra-06",
+        "Umbra-04",
+    ]
+    archive = opportunities.filter(opportunities.item_id != None)  # noqa: E711
+    assert archive.item_id.tolist() == ["item-1"]
+    assert hours(opportunities.sort()) == [1, 2, 3]
+    assert opportunities.sort().satellite_ids().tolist() == ["Umbra-05", "Umbra-06", "Umbra-04"]
+    assert opportunities.sort(descending=True).satellite_ids().tolist() == [
+        "Umbra-04",
+        "Umbra-06",
+        "Umbra-05",
+    ]
+
+
+def test_geojson_bytes_match_opportunity_models():
+    opportunities = build(
+        [(0, "Umbra-04", "task"), (1, "Umbra-05", "archive"), (2, "Umbra-04", "archive")]
+    )
+
+    collection = json.loads(opportunities.to_geojson_bytes())
+
+    assert collection["type"] == "FeatureCollection"
+    features = [Opportunity.model_validate(f) for f in collection["features"]]
+    assert features == opportunities.to_opportunities()
+    assert features[1].links[0].body == {"archive_id": "item-1"}
+    assert features[0].links[0].body["product_id"] == "umbra_spotlight"
+
+
+def test_missing_angles_are_encoded_as_null():
+    item = CanopyStub(archive_items=1)._archive_page({})["features"][0]
+    item["properties"]["umbra:target_azimuth_angle_degrees"] = None
+
+    opportunities = stac_items_to_opportunity_set([item], "umbra_spotlight")
+    feature = json.loads(opportunities.to_geojson_bytes())["features"][0]
+
+    assert feature["properties"]["target_azimuth_angle_degrees"] == [None, None]
+    assert feature["properties"]["grazing_angle_degrees"][0] is not None
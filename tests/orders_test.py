@@ -0,0 +1,35 @@
+import logging
+from datetime import datetime, timedelta, timezone
+
+from fastapi.testclient import TestClient
+from stapi_fastapi_umbra.soak import POINT, CanopyStub
+
+START = datetime.now(tz=timezone.utc) + timedelta(days=1)
+ORDER = {
+    "geometry": POINT,
+    "datetime": f"{START.isoformat()}/{(START + timedelta(minutes=15)).isoformat()}",
+    "product_id": "umbra_spotlight",
+}
+POLYGON = {
+    "type": "Polygon",
+    "coordinates": [[[-112.1, 40.5], [-112.0, 40.5], [-112.0, 40.6], [-112.1, 40.5]]],
+}
+
+
+def test_batch_reports_each_order(api: TestClient):
+    response = api.post("/orders/batch", json=[ORDER, {**ORDER, "geometry": POLYGON}])
+
+    assert response.status_code == 207
+    created, rejected = response.json()["results"]
+    assert created["status"] == 201
+    assert rejected["status"] == 422
+    assert "Point" in rejected["detail"]
+
+
+def test_batch_logs_unexpected_errors(api: TestClient, stub: CanopyStub, monkeypatch, caplog):
+    monkeypatch.setattr(stub, "_task", lambda *args: {"unexpected": True})
+    with caplog.at_level(logging.ERROR):
+        response = api.post("/orders/batch", json=[ORDER])
+
+    assert response.json()["results"] == [{"status": 500, "detail": "unable to create order"}]
+    assert "unable to create order" in caplog.text
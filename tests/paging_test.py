@@ -0,0 +1,89 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+from stapi_fastapi_umbra.soak import POINT, TOKEN, CanopyStub
+
+NOW = datetime.now(tz=timezone.utc)
+ARCHIVE_SEARCH = {
+    "geometry": POINT,
+    "datetime": f"{(NOW - timedelta(days=30)).isoformat()}/{(NOW - timedelta(days=1)).isoformat()}",
+    "product_id": "umbra_spotlight",
+}
+SEARCH = {
+    **ARCHIVE_SEARCH,
+    "datetime": f"{(NOW - timedelta(days=30)).isoformat()}/{(NOW + timedelta(days=2)).isoformat()}",
+}
+
+
+@pytest.fixture
+def stub() -> CanopyStub:
+    return CanopyStub(archive_items=12, feasibility_opportunities=4, archive_page_size=5)
+
+
+def next_link(response) -> dict | None:
+    return next((link for link in response.json().get("links", []) if link["rel"] == "next"), None)
+
+
+def feature_id(feature: dict) -> str:
+    archive_id = feature["links"][0]["body"].get("archive_id")
+    return archive_id or feature["properties"]["datetime"]
+
+
+def pages(api: TestClient, search: dict, limit: int) -> list[list[str]]:
+    response = api.post(f"/opportunities?limit={limit}", json=search)
+    ids = []
+    while True:
+        assert response.status_code == 200, response.text
+        ids.append([feature_id(f) for f in response.json()["features"]])
+        link = next_link(response)
+        if link is None:
+            return ids
+        response = api.post(link["href"], json=link["body"])
+
+
+def test_search_without_limit_fetches_one_archive_page(api: TestClient, stub: CanopyStub):
+    response = api.post("/opportunities", json=ARCHIVE_SEARCH)
+
+    assert len(response.json()["features"]) == 5
+    assert stub.archive_requests == 1
+
+
+def test_pages_fetch_archive_pages_as_they_are_reached(api: TestClient, stub: CanopyStub):
+    api.post("/opportunities?limit=3", json=ARCHIVE_SEARCH)
+    assert stub.archive_requests == 1
+
+    archive_pages = pages(api, ARCHIVE_SEARCH, 4)
+    assert [len(p) for p in archive_pages] == [4, 4, 4]
+    ids = [i for p in archive_pages for i in p]
+    assert ids == [f"archive-{i}" for i in range(12)]
+
+
+def test_pages_continue_into_feasibility(api: TestClient):
+    unpaged = [feature_id(f) for f in api.post("/opportunities", json=SEARCH).json()["features"]]
+    feasibility = unpaged[5:]
+    assert feasibility
+
+    all_pages = pages(api, SEARCH, 5)
+    assert all(len(p) == 5 for p in all_pages[:-1])
+    assert [i for p in all_pages for i in p] == [f"archive-{i}" for i in range(12)] + feasibility
+
+
+def test_later_pages_do_not_call_canopy_again(api: TestClient, stub: CanopyStub):
+    all_pages = pages(api, SEARCH, 1)
+
+    assert len(all_pages) > 12
+    assert stub.archive_requests == 3
+    assert stub.feasibility_requests == 1
+
+
+def test_cursor_is_bound_to_caller_and_search(api: TestClient):
+    link = next_link(api.post("/opportunities?limit=3", json=ARCHIVE_SEARCH))
+
+    other_caller = api.post(
+        link["href"], json=link["body"], headers={"Authorization": f"Bearer not-{TOKEN}"}
+    )
+    other_search = api.post(link["href"], json={**link["body"], "product_id": "other"})
+    assert other_caller.status_code == 404
+    assert other_search.status_code == 404
+    assert api.post(link["href"], json=link["body"]).status_code == 200
@@ -0,0 +1,58 @@
+import asyncio
+
+import httpx
+from stapi_fastapi_umbra.client import ClientPools
+
+
+def make_pools() -> ClientPools:
+    pools = ClientPools(max_connections=1, max_credentials=2)
+    pools.transport = httpx.MockTransport(lambda request: httpx.Response(200))
+    return pools
+
+
+def test_idle_pools_are_closed_when_evicted():
+    async def run() -> list[httpx.AsyncClient]:
+        clients = []
+        for tenant in "abc":
+            async with pools.client(tenant) as http:
+                clients.append(http)
+        return clients
+
+    pools = make_pools()
+    a, b, c = asyncio.run(run())
+    assert a.is_closed
+    assert not b.is_closed and not c.is_closed
+
+
+def test_evicted_pool_stays_open_for_requests_in_flight():
+    async def run() -> None:
+        async with pools.client("a") as http:
+            async with pools.client("b"), pools.client("c"):
+                pass
+            assert not http.is_closed
+            await http.get("https://canopy.example")
+        assert http.is_closed
+
+    pools = make_pools()
+    asyncio.run(run())
+
+
+def test_calls_wait_for_their_own_credentials_slots():
+    async def run() -> list[str]:
+        entered: list[str] = []
+
+        async def call(tenant: str, release: asyncio.Event) -> None:
+            async with pools.client(tenant):
+                entered.append(tenant)
+                await release.wait()
+
+        release = asyncio.Event()
+        tasks = [asyncio.create_task(call(t, release)) for t in "aab"]
+        await asyncio.sleep(0.01)
+        before_release = list(entered)
+        release.set()
+        await asyncio.gather(*tasks)
+        return before_release
+
+    pools = make_pools()
+    assert asyncio.run(run()) == ["a", "b"]
@@ -0,0 +1,88 @@
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("sgp4")
+
+from stapi_fastapi_umbra.models import SpotlightConstraints  # noqa: E402
+from stapi_fastapi_umbra.parameters import DEFAULT_SATELLITE_IDS  # noqa: E402
+from stapi_fastapi_umbra.prescreen import Prescreener, load_tles  # noqa: E402
+from stapi_fastapi_umbra.settings import Settings  # noqa: E402
+
+TLE_PATH = Path(__file__).parent / "fixtures" / "umbra.tle"
+START = datetime(2024, 10, 17, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def constraints() -> SpotlightConstraints:
+    return SpotlightConstraints(geometry={"type": "Point", "coordinates": [-112.146, 40.522]})
+
+
+def test_load_tles_matches_names_case_insensitively():
+    tles = load_tles(TLE_PATH, DEFAULT_SATELLITE_IDS)
+    assert list(tles) == DEFAULT_SATELLITE_IDS
+    assert all(line1.startswith("1 ") and line2.startswith("2 ") for line1, line2 in tles.values())
+
+
+def test_load_tles_rejects_partial_constellation(tmp_path: Path):
+    partial = tmp_path / "partial.tle"
+    partial.write_text("\n".join(TLE_PATH.read_text().splitlines()[:6]))
+    with pytest.raises(ValueError, match="Umbra-07"):
+        load_tles(partial, DEFAULT_SATELLITE_IDS)
+
+
+def test_prescreener_rejects_empty_tles():
+    with pytest.raises(ValueError):
+        Prescreener({})
+
+
+def test_from_settings():
+    assert Prescreener.from_settings(Settings(prescreen_tle_path=None)) is None
+    prescreener = Prescreener.from_settings(Settings(prescreen_tle_path=str(TLE_PATH)))
+    assert prescreener.satellite_ids == DEFAULT_SATELLITE_IDS
+
+
+def test_candidate_intervals_cover_every_visible_sample(constraints: SpotlightConstraints):
+    prescreener = Prescreener(load_tles(TLE_PATH, DEFAULT_SATELLITE_IDS), merge_gap_seconds=0)
+    end = START + timedelta(days=1)
+    intervals = prescreener.candidate_intervals(constraints, START, end)
+
+    assert intervals
+    assert all(START <= a < b <= end for a, b in intervals)
+    assert all(a[1] < b[0] for a, b in zip(intervals, intervals[1:]))
+
+    lon, lat = constraints.geometry.coordinates[:2]
+    t, grazing = prescreener.grazing_angles(lon, lat, START, end)
+    low = constraints.grazingAngleMinDegrees - prescreener.grazing_angle_margin_degrees
+    high = constraints.grazingAngleMaxDegrees + prescreener.grazing_angle_margin_degrees
+    visible = ((grazing >= low) & (grazing <= high)).any(axis=0)
+    for sample in t[visible]:
+        when = datetime.fromtimestamp(sample, tz=timezone.utc)
+        assert any(a <= when <= b for a, b in intervals)
+    assert sum((b - a for a, b in intervals), timedelta()) < end - START
+
+
+def test_old_tles_are_not_used_to_screen(
+    tmp_path: Path, constraints: SpotlightConstraints, caplog: pytest.LogCaptureFixture
+):
+    old = tmp_path / "old.tle"
+    old.write_text(TLE_PATH.read_text().replace("24290.50000000", "24260.50000000", 1))
+    prescreener = Prescreener(load_tles(old, DEFAULT_SATELLITE_IDS))
+
+    assert prescreener.stale_satellites(START, START + timedelta(days=1)) == ["Umbra-04"]
+    assert prescreener.candidate_intervals(constraints, START, START + timedelta(days=1)) is None
+    assert "Umbra-04" in caplog.text
+
+    current = Prescreener(load_tles(TLE_PATH, DEFAULT_SATELLITE_IDS))
+    assert current.stale_satellites(START, START + timedelta(days=1)) == []
+    assert current.stale_satellites(START, START + timedelta(days=7)) == DEFAULT_SATELLITE_IDS
+
+
+def test_candidate_intervals_merge_nearby_passes(constraints: SpotlightConstraints):
+    tles = load_tles(TLE_PATH, DEFAULT_SATELLITE_IDS)
+    end = START + timedelta(days=2)
+    separate = Prescreener(tles, merge_gap_seconds=0).candidate_intervals(constraints, START, end)
+    merged = Prescreener(tles).candidate_intervals(constraints, START, end)
+    assert len(merged) < len(separate)
+    assert merged[0][0] == separate[0][0] and merged[-1][1] == separate[-1][1]
@@ -0,0 +1,122 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+from stapi_fastapi_umbra.backend import settings
+from stapi_fastapi_umbra.soak import POINT, CanopyStub
+from stapi_fastapi_umbra.stats import ArchiveStats
+
+NOW = datetime.now(tz=timezone.utc)
+
+
+def scene(start: str) -> dict:
+    return {
+        "properties": {
+            "start_datetime": start,
+            "platform": "Umbra-04",
+            "umbra:grazing_angle_degrees": 42.0,
+            "umbra:target_azimuth_angle_degrees": 370.0,
+        }
+    }
+
+
+def search(days: int) -> dict:
+    return {
+        "geometry": POINT,
+        "datetime": f"{(NOW - timedelta(days=30)).isoformat()}/{(NOW - timedelta(days=30 - days)).isoformat()}",
+        "product_id": "umbra_spotlight",
+    }
+
+
+@pytest.fixture
+def stub() -> CanopyStub:
+    return CanopyStub(archive_items=12, archive_page_size=5)
+
+
+def test_only_scenes_in_range_are_counted():
+    stats = ArchiveStats(
+        datetime(2024, 1, 15, tzinfo=timezone.utc), datetime(2024, 3, 15, tzinfo=timezone.utc)
+    )
+    stats.add(
+        [
+            scene("2024-01-10T00:00:00Z"),
+            scene("2024-01-20T00:00:00Z"),
+            scene("2024-03-01T00:00:00+00:00"),
+            scene("2024-03-20T00:00:00Z"),
+        ]
+    )
+    result = stats.to_dict()
+
+    assert result["total"] == 2
+    assert result["out_of_range"] == 2
+    assert result["months"]["counts"] == [1, 0, 1]
+    assert result["platforms"]["Umbra-04"] == 2
+    assert sum(result["grazing_angle_degrees"]["counts"]) == 2
+    assert result["target_azimuth_angle_degrees"]["counts"][0] == 2
+    assert result["truncated"] is False
+
+
+def test_months_are_counted_in_utc():
+    # 2024-02-01T03:00+05:00 is still January in UTC, as is the scene.
+    stats = ArchiveStats(
+        datetime(2024, 2, 1, 3, tzinfo=timezone(timedelta(hours=5))),
+        datetime(2024, 2, 29, 23, tzinfo=timezone(timedelta(hours=-5))),
+    )
+    stats.add(
+        [
+            scene("2024-01-31T23:00:00Z"),
+            scene("2024-02-15T12:00:00+09:00"),
+            scene("2024-03-01T02:00:00Z"),
+        ]
+    )
+    result = stats.to_dict()
+
+    assert result["total"] == 3
+    assert result["months"]["start"] == ["2024-01", "2024-02", "2024-03"]
+    assert result["months"]["counts"] == [1, 1, 1]
+
+
+def test_stats_for_an_offset_search(api: TestClient):
+    offset = timezone(timedelta(hours=-7))
+    start, end = NOW - timedelta(days=30), NOW - timedelta(days=1)
+    body = search(days=29) | {
+        "datetime": f"{start.astimezone(offset).isoformat()}/{end.astimezone(offset).isoformat()}"
+    }
+    response = api.post("/opportunities/stats", json=body)
+
+    assert response.status_code == 200
+    assert sum(response.json()["months"]["counts"]) == response.json()["total"]
+
+
+def test_stats_follow_every_archive_page(api: TestClient, stub: CanopyStub):
+    result = api.post("/opportunities/stats", json=search(days=29)).json()
+
+    assert stub.archive_requests == 3
+    assert result["total"] == 12
+    assert result["truncated"] is False
+
+
+def test_stats_report_scenes_outside_the_search(api: TestClient):
+    # The stub returns all its scenes, one a day from 30 days ago.
+    result = api.post("/opportunities/stats", json=search(days=5)).json()
+
+    assert result["total"] + result["out_of_range"] == 12
+    assert result["out_of_range"] >= 6
+
+
+def test_stats_are_truncated_at_the_page_limit(api: TestClient, monkeypatch):
+    monkeypatch.setattr(settings, "archive_stats_max_pages", 2)
+    result = api.post("/opportunities/stats", json=search(days=29)).json()
+
+    assert result["total"] == 10
+    assert result["truncated"] is True
+
+
+def test_stats_are_truncated_at_the_deadline(api: TestClient, stub: CanopyStub, monkeypatch):
+    stub.latency = 0.2
+    monkeypatch.setattr(settings, "opportunity_stats_timeout", 0.5)
+    response = api.post("/opportunities/stats", json=search(days=29))
+
+    assert response.status_code == 200
+    assert response.json()["total"] == 10
+    assert response.json()["truncated"] is True
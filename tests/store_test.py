@@ -0,0 +1,52 @@
+import asyncio
+import sqlite3
+from pathlib import Path
+
+import pytest
+from stapi_fastapi_umbra.store import DiskCache
+
+
+@pytest.fixture
+def disk_cache(tmp_path: Path):
+    cache = DiskCache(tmp_path / "cache.db")
+    yield cache
+    cache.close()
+
+
+def test_new_database_uses_incremental_auto_vacuum(disk_cache: DiskCache):
+    connection = sqlite3.connect(disk_cache.path)
+    assert connection.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+    assert connection.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+
+def test_existing_database_is_switched_to_auto_vacuum(tmp_path: Path):
+    path = tmp_path / "legacy.db"
+    connection = sqlite3.connect(path)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("CREATE TABLE legacy (id INTEGER)")
+    connection.close()
+
+    DiskCache(path).close()
+    assert sqlite3.connect(path).execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+
+
+def test_get_many_batches_lookups(disk_cache: DiskCache):
+    entries = [(f"key-{i}", f"value-{i}".encode(), 60) for i in range(1200)]
+    disk_cache.set_many("test", entries)
+    disk_cache.set_many("test", [("expired", b"value", -1)])
+
+    found = disk_cache.get_many("test", [f"key-{i}" for i in range(0, 1300, 2)] + ["expired"])
+    assert len(found) == 600
+    assert found["key-1000"].value == b"value-1000"
+    assert disk_cache.get_many("other", ["key-0"]) == {}
+
+
+def test_locked_database_reads_as_a_miss(disk_cache: DiskCache, monkeypatch):
+    class Locked:
+        def execute(self, *args):
+            raise sqlite3.OperationalError("database is locked")
+
+    disk_cache.set_many("test", [("key", b"value", 60)])
+    monkeypatch.setattr(disk_cache, "_connection", Locked)
+    assert asyncio.run(disk_cache.read("test", ["key"])) == {}
+